@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import time
+import weakref
 import re
 import math
 from collections import OrderedDict as OD
@@ -8,6 +9,7 @@ from collections import OrderedDict as OD
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from matplotlib.colors import colorConverter
 
 from persistlab import measfile
 ##from persistlab import figitem
@@ -15,6 +17,205 @@ from persistlab import batlab
 
 __version__ = '0.0'
 
+# Cyclic voltammetry engine
+
+def sweep_directions(E):
+    """return the direction of the potential sweep at each sample of E, 
+    1 rising and -1 falling, that of the step to the sample; the steps 
+    leaving the potential unchanged keep the previous direction"""
+    E = np.asarray(E, float)
+    step = np.sign(np.diff(E))
+    moving = np.flatnonzero(step)
+    if not len(moving):
+        return np.ones(len(E))
+    # Position of the last step that moved, the first one at the start
+    pos = np.maximum.accumulate(np.where(step != 0, 
+                                         np.arange(len(step)), moving[0]))
+    step = step[pos]
+    return np.concatenate([step[:1], step])
+
+def sweep_ids(E):
+    """return the sweep of each sample, the vertex of a reversal ending 
+    its sweep"""
+    d = sweep_directions(E)
+    return np.concatenate([[0], np.cumsum(d[1:] != d[:-1])])
+
+def cycle_ids(E):
+    """return the cycle of each sample, a cycle being two sweeps"""
+    return sweep_ids(E) // 2
+
+def _peaks(E, I, starts, sign):
+    """return the potentials and currents of the extrema of the currents, 
+    maxima on the rising branch (sign 1), minima on the falling one 
+    (sign -1), of each group of rows starting at starts"""
+    n = len(I)
+    branch = (sweep_directions(E) == sign)[:, None]
+    masked = np.where(branch & ~np.isnan(I), I * sign, -np.inf)
+    peak = np.maximum.reduceat(masked, starts, axis=0)
+    lengths = np.diff(np.append(starts, n))
+    # First row of each peak
+    rows = np.where(masked == np.repeat(peak, lengths, axis=0), 
+                    np.arange(n)[:, None], n)
+    first = np.minimum.reduceat(rows, starts, axis=0)
+    missing = np.isinf(peak)
+    Ep = np.where(missing, np.nan, E[np.minimum(first, n - 1)])
+    ip = np.where(missing, np.nan, peak * sign)
+    return Ep, ip
+
+def cv_quantity(quantity, E, I, starts):
+    """return the quantity of the cyclic voltammograms, the currents I 
+    (2d, a column per channel) against the potential E, for each group of 
+    rows starting at starts, all computed at once:
+    
+    epa, ipa: potential and current of the anodic peak
+    epc, ipc: potential and current of the cathodic peak
+    qva, qvc: anodic and cathodic charges times the scan rate, i.e. the 
+    integrals of the current over the potential swept, in A.V: divide 
+    them by the scan rate of the header, in V/s, for the charges in C
+    cycles: number of cycles"""
+    E = np.asarray(E, float)
+    I = np.asarray(I, float)
+    d = sweep_directions(E)
+    if quantity == 'cycles':
+        cycles = cycle_ids(E)
+        n = np.maximum.reduceat(cycles, starts) - \
+            np.minimum.reduceat(cycles, starts) + 1
+        return np.repeat(n[:, None], I.shape[1], axis=1).astype(float)
+    if quantity in ('epa', 'ipa', 'epc', 'ipc'):
+        Ep, ip = _peaks(E, I, starts, quantity[-1] == 'a' and 1 or -1)
+        return Ep if quantity[0] == 'e' else ip
+    # Trapezes of the consecutive samples of a branch, but across groups
+    branch = d > 0 if quantity == 'qva' else d < 0
+    areas = np.zeros_like(I)
+    areas[:-1] = np.abs(np.diff(E))[:, None] * (I[1:] + I[:-1]) / 2
+    areas[:-1][~branch[1:]] = 0.
+    areas[starts[1:] - 1] = 0.
+    return np.add.reduceat(areas, starts, axis=0)
+
+
+class CVProcessor(object):
+    
+    """Processor of a cyclic voltammetry quantity, see cv_quantity, 
+    of the whole channels or of their segments at once"""
+    
+    def __init__(self, quantity):
+        self.quantity = quantity
+    
+    def __call__(self, series):
+        return self.reduce_segments(series.values[:, None], np.zeros(1, int), 
+                                    index=series.index.values)[0, 0]
+    
+    def reduce_segments(self, values, starts, index):
+        return cv_quantity(self.quantity, index, values, starts)
+
+# plab_processor entry points
+cv_epa = CVProcessor('epa')
+cv_ipa = CVProcessor('ipa')
+cv_epc = CVProcessor('epc')
+cv_ipc = CVProcessor('ipc')
+cv_qva = CVProcessor('qva')
+cv_qvc = CVProcessor('qvc')
+cv_cycles = CVProcessor('cycles')
+
+
+# Transient fitting
+
+# Model: abscissa of the log-linearised model, parameters from the 
+# intercept and the slope of log|I|
+TRANSIENT_MODELS = {
+    # I = k t^exponent, exponent -1/2 for a Cottrell transient
+    'cottrell':(np.log, ('k', 'exponent'), lambda b0, b1: (np.exp(b0), b1)),
+    # I = amplitude exp(-t/tau)
+    'exponential':(lambda t: t, ('amplitude', 'tau'), 
+                   lambda b0, b1: (np.exp(b0), -1. / b1))}
+
+def fit_transients(model, I, t):
+    """return the dictionary of the parameters of the model fitted to each 
+    column of the currents I (2d) against the times t (2d, broadcast 
+    against I, e.g. a single column), 
+    and of the root mean square of the residuals of the currents 'rms'.
+    
+    log|I| is fitted to a line by least squares, the normal equations of 
+    all the columns being solved at once. The samples of the other sign 
+    than the sum of the column, null, Nan, or at t <= 0 for cottrell, 
+    are skipped."""
+    x_of, names, params = TRANSIENT_MODELS[model]
+    I = np.asarray(I, float)
+    t = np.asarray(t, float)
+    sign = np.where(np.nansum(I, axis=0) < 0, -1., 1.)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x = x_of(t)
+        y = np.log(I * sign)
+        w = np.isfinite(x) & np.isfinite(y)
+        x = np.where(w, x, 0.)
+        y = np.where(w, y, 0.)
+        # Sums of the normal equations of each column
+        S0, Sx, Sy = w.sum(axis=0), x.sum(axis=0), y.sum(axis=0)
+        Sxx, Sxy = (x * x).sum(axis=0), (x * y).sum(axis=0)
+        det = S0 * Sxx - Sx * Sx
+        b1 = np.where(det > 0, (S0 * Sxy - Sx * Sy) / det, np.nan)
+        b0 = (Sy - b1 * Sx) / S0
+        res = dict(zip(names, params(b0, b1)))
+        res[names[0]] *= sign
+        fitted = sign * np.exp(b0 + b1 * x)
+        res['rms'] = np.sqrt(np.where(w, (I - fitted) ** 2, 0.).sum(axis=0) 
+                             / S0)
+    res['rms'][np.isnan(b1)] = np.nan
+    return res
+
+# Model: weak references to the last currents and times fitted, and the fit
+_last_fits = {}
+
+def fit_stack(model, I, t):
+    """fit_transients, the fit of the last arrays I and t kept for each 
+    model, so the processors of its parameters fit a stack once"""
+    refs = _last_fits.get(model)
+    if refs and refs[0]() is I and refs[1]() is t:
+        return refs[2]
+    res = fit_transients(model, I, t)
+    _last_fits[model] = (weakref.ref(I), weakref.ref(t), res)
+    return res
+
+
+class TransientProcessor(object):
+    
+    """Processor of a parameter of a model fitted to the transients, 
+    see fit_transients, of all the channels of all the files at once, 
+    fitted once for all the parameters of the model, see fit_stack"""
+    
+    def __init__(self, model, param):
+        self.model = model
+        self.param = param
+    
+    def __call__(self, series):
+        return self.reduce_stack(series.values[:, None], 
+                                 series.index.values[:, None])[0]
+    
+    def reduce_stack(self, values, index):
+        return fit_stack(self.model, values, index)[self.param]
+
+# plab_processor entry points
+transient_cottrell_k = TransientProcessor('cottrell', 'k')
+transient_cottrell_exponent = TransientProcessor('cottrell', 'exponent')
+transient_cottrell_rms = TransientProcessor('cottrell', 'rms')
+transient_exponential_amplitude = TransientProcessor('exponential', 
+                                                     'amplitude')
+transient_exponential_tau = TransientProcessor('exponential', 'tau')
+transient_exponential_rms = TransientProcessor('exponential', 'rms')
+
+
+class CVFile(measfile.XSegFile):
+    
+    """Cyclic voltammetry data file, whose segments are the cycles of the 
+    potential, e.g. to compute the processors for each cycle"""
+    
+    def _parse_data(self, *args, **kwargs):
+        df = measfile.XSegFile._parse_data(self, *args, **kwargs)
+        cycles = cycle_ids(df.index.values)
+        dtype = np.min_scalar_type(cycles[-1] if len(cycles) else 0)
+        self.segment_ids = cycles.astype(dtype)
+        return df
+
 class FigTransient(batlab.DefaultFigure):
     
     def __init__(self, *args, **kwargs):
@@ -26,6 +227,7 @@ class FigTransient(batlab.DefaultFigure):
 class FigCV(batlab.DefaultFigure):
     
     di_settings = {'arrow_size' : 4, 
+                'cycle_lighten' : 0.6, 
 ##                'arrow_xpos' : 0.005, 
 ##                'seg_start':3, 
 ##                'seg_stop':4, 
@@ -35,26 +237,52 @@ class FigCV(batlab.DefaultFigure):
         super(FigCV, self).__init__(*args, **kwargs)
         self.figure_items ['ax.xlabel'] = 'Potential (V)'
         self.figure_items ['ax.ylabel'] = 'Current (A)'
+        # Line of a series: lines of its cycles after the first one
+        self.cycles = {}
     
     def plot_series(self, series, verbose=0, *args, **kwargs):
         super(FigCV, self).plot_series(series, *args, **kwargs)
+        E = series.index.values
+        I = series.values
+        if not len(E):
+            return
+        self.plot_cycles(self.lines[-1], E, I)
         
-        # Plot an arrow
-        if kwargs['i'] == 0:
-            xlim = self.ax.get_xlim()
-            if xlim[0]>xlim[1]:
-                xlim = tuple(reversed(xlim))
-            if verbose > 1:
-                print str(xlim)
-            x0 = xlim[1]-(1./4)*(xlim[1]-xlim[0])
-            x_arrow = x0 + kwargs['i']*0.005
+        # Plot an arrow in the middle of the first sweep
+        if kwargs.get('i', 0) == 0:
+            k = np.count_nonzero(sweep_ids(E) == 0) // 2
+            # The potential axis is inverted
+            marker = sweep_directions(E)[k] > 0 and '<' or '>'
             if verbose > 1:
-                print '{}'.format(x_arrow)
-            
-            X = series.index[series.index.searchsorted(x_arrow)]
-            plt.plot (X, series[X][0], '>', 
-                                markersize = self.di_settings['arrow_size'], 
-                                color = "k")
+                print '{} {}'.format(E[k], marker)
+            self.ax.plot(E[k], I[k], marker, 
+                         markersize = self.di_settings['arrow_size'], 
+                         color = "k")
+    
+    def plot_cycles(self, line, E, I):
+        """Colour the cycles after the first one, drawn over the line, 
+        in lighter and lighter shades of its colour and in its style"""
+        starts = measfile.segment_starts(cycle_ids(E))
+        stops = np.append(starts[1:], len(E))
+        rgb = np.array(colorConverter.to_rgb(line.get_color()))
+        lighten = self.di_settings['cycle_lighten']
+        self.cycles[line] = []
+        for c in range(1, len(starts)):
+            # Joined to the end of the previous cycle
+            a, b = starts[c] - 1, stops[c]
+            shade = rgb + (1 - rgb) * lighten * c / (len(starts) - 1)
+            self.cycles[line] += line.axes.plot(E[a:b], I[a:b], 
+                                    label='_nolegend_', color=tuple(shade), 
+                                    linestyle=line.get_linestyle())
+    
+    def set_line_data(self, line, series):
+        """Set the data of the line and of its cycles to the series, 
+        e.g. of a followed file"""
+        super(FigCV, self).set_line_data(line, series)
+        for cycle in self.cycles.pop(line, []):
+            cycle.remove()
+        if len(series):
+            self.plot_cycles(line, series.index.values, series.values)
     
     def adorn(self, **kwargs):
         self.ax.axes.invert_xaxis()
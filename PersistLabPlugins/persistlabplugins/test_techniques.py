@@ -2,6 +2,14 @@
 
 import unittest
 
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from matplotlib.colors import colorConverter
+
+from persistlab import measfile
+# The caches in a temporary directory
+from persistlab import testsuite
 from persistlab.batlab_plugins import PersistLabPlugins
 from persistlabplugins import techniques
 from persistlabplugins import data
@@ -42,6 +50,177 @@ class CVFigure(Figure, unittest.TestCase):
                         data_channels = [0, 1])
 
 
+def triangle(ncycles, n=50, high=0.2, low=-0.6):
+    """return the potentials of ncycles cycles starting at high"""
+    down = np.linspace(high, low, n)
+    sweeps = [down[:-1], down[::-1][:-1]] * ncycles
+    return np.concatenate(sweeps + [[high]])
+
+
+class CVEngine(unittest.TestCase):
+    
+    def setUp(self):
+        self.E = triangle(3)
+        rs = np.random.RandomState(0)
+        self.I = np.column_stack([np.sin(7 * np.arange(len(self.E))), 
+                                  rs.randn(len(self.E))])
+        self.names = ['epa', 'ipa', 'epc', 'ipc', 'qva', 'qvc', 'cycles']
+    
+    def test_ids(self):
+        ids = techniques.sweep_ids(self.E)
+        self.assertEqual(list(np.bincount(ids)), [50] + [49] * 5)
+        # The vertices end their sweeps
+        self.assertEqual(self.E[ids == 1][-1], 0.2)
+        self.assertEqual(techniques.cycle_ids(self.E).max(), 2)
+        # Steps leaving the potential unchanged
+        E = [0., 0., 1., 1., 2., 1., 1., 0.]
+        self.assertEqual(list(techniques.sweep_ids(E)), [0] * 5 + [1] * 3)
+    
+    def reference(self, name, E, I):
+        """the quantity name of the cycle E, I computed point by point"""
+        d = np.sign(np.diff(E))
+        if name == 'cycles':
+            return 1
+        if name[0] in 'ei':
+            branch = [0] + list(d)
+            rows = [k for k in range(len(E)) if branch[k] == 
+                    (name[-1] == 'a' and 1 or -1)]
+            k = (name[-1] == 'a' and max or min)(rows, key=lambda k: I[k])
+            return name[0] == 'e' and E[k] or I[k]
+        return sum(abs(E[k+1] - E[k]) * (I[k+1] + I[k]) / 2 
+                   for k in range(len(d)) 
+                   if d[k] == (name == 'qva' and 1 or -1))
+    
+    def test_quantities(self):
+        ids = techniques.cycle_ids(self.E)
+        starts = measfile.segment_starts(ids)
+        for name in self.names:
+            res = techniques.cv_quantity(name, self.E, self.I, starts)
+            self.assertEqual(res.shape, (3, 2))
+            for c in range(3):
+                for j in range(2):
+                    ref = self.reference(name, self.E[ids == c], 
+                                         self.I[ids == c, j])
+                    self.assertAlmostEqual(res[c, j], ref)
+    
+    def test_processor(self):
+        s = pd.Series(self.I[:, 0], index=self.E)
+        self.assertEqual(techniques.cv_cycles(s), 3)
+        self.assertAlmostEqual(techniques.cv_ipc(s), 
+                               self.reference('ipc', self.E, self.I[:, 0]))
+    
+    def test_cvfile(self):
+        mf = techniques.CVFile(data.LIFNCV[0])
+        self.assertEqual(list(np.unique(mf.segment_ids)), [0, 1])
+        dp = measfile.DataProcessor()
+        for name in self.names:
+            dp.processors['cv.' + name] = getattr(techniques, 'cv_' + name)
+        stats = dp.compute([mf], data_process=['cv.' + n for n in self.names], 
+                           data_process_segments=1)
+        self.assertEqual(list(stats['cv.cycles'].values.ravel()), [1] * 6)
+        # Cathodic peak of the first sweep in the header of the file
+        self.assertAlmostEqual(stats['cv.epc'].loc[0].iloc[0, 0], -0.195, 2)
+    
+    def test_figure(self):
+        mf = techniques.CVFile(data.LIFNCV[0])
+        fig = techniques.FigCV()
+        fig.plot_series(mf.dfs().iloc[:, 0], i=0)
+        # The line, the second cycle and the arrow
+        self.assertEqual(len(fig.ax.lines), 3)
+        plt.close('all')
+    
+    def test_figure_cycles(self):
+        s = techniques.CVFile(data.LIFNCV[0]).dfs().iloc[:, 0]
+        fig = techniques.FigCV()
+        for i in range(2):
+            fig.plot_series(s, i=i, figure_use_color=1)
+        lilines = [[line] + fig.cycles[line] for line in fig.lines]
+        # The cycles of a file are shades of its colour, told apart 
+        # from those of the other files
+        for lines in lilines:
+            rgb = [np.array(colorConverter.to_rgb(l.get_color())) 
+                   for l in lines]
+            self.assertTrue((rgb[1] >= rgb[0]).all())
+            self.assertTrue((rgb[1] > rgb[0]).any())
+        self.assertNotEqual(lilines[0][1].get_color(), 
+                            lilines[1][1].get_color())
+        # The cycles follow the data of the line
+        n = np.count_nonzero(techniques.cycle_ids(s.index.values) == 0)
+        fig.update_lines([s.iloc[:n], s])
+        self.assertEqual(len(fig.cycles[fig.lines[0]]), 0)
+        self.assertEqual(len(fig.cycles[fig.lines[1]]), 1)
+        fig.update_lines([s, s])
+        self.assertEqual(len(fig.cycles[fig.lines[0]]), 1)
+        # The lines, the second cycles and the arrow
+        self.assertEqual(len(fig.ax.lines), 5)
+        plt.close('all')
+
+
+class TransientFit(unittest.TestCase):
+    
+    def setUp(self):
+        t = np.arange(1, 201) * 0.1
+        self.df = pd.DataFrame({'cottrell':-3e-7 / np.sqrt(t), 
+                                'exponential':2e-6 * np.exp(-t / 4.)}, 
+                               index=t, columns=['cottrell', 'exponential'])
+        self.names = ['transient.{}.{}'.format(m, p) for m, lip in 
+                      [('cottrell', ['k', 'exponent']), 
+                       ('exponential', ['amplitude', 'tau'])] 
+                      for p in lip + ['rms']]
+        self.dp = measfile.DataProcessor()
+        for name in self.names:
+            self.dp.processors[name] = getattr(techniques, 
+                                               name.replace('.', '_'))
+    
+    def test_models(self):
+        res = techniques.fit_transients('cottrell', self.df.values, 
+                                        np.column_stack([self.df.index] * 2))
+        self.assertAlmostEqual(res['k'][0] * 1e7, -3)
+        self.assertAlmostEqual(res['exponent'][0], -0.5)
+        self.assertAlmostEqual(res['rms'][0] * 1e7, 0)
+        res = techniques.fit_transients('exponential', self.df.values, 
+                                        np.column_stack([self.df.index] * 2))
+        self.assertAlmostEqual(res['amplitude'][1] * 1e6, 2)
+        self.assertAlmostEqual(res['tau'][1], 4)
+        self.assertTrue(res['rms'][0] > 1e-8)
+    
+    def test_nan(self):
+        I = np.array([[np.nan, 0., 1., 2.], [np.nan] * 4]).T
+        res = techniques.fit_transients('exponential', I, 
+                                        np.ones((4, 2)) * [[0], [1], [2], [3]])
+        self.assertAlmostEqual(res['tau'][0], -1. / np.log(2))
+        self.assertTrue(np.isnan(res['tau'][1]) and np.isnan(res['rms'][1]))
+    
+    def test_batched(self):
+        limf = [techniques.CVFile(fn) for fn in data.LIFNCV] + \
+               [measfile.FlatFile(fn) for fn in data.LIFNTRANSIENT] * 2
+        limf[-1].df = limf[-1].df.iloc[:-10]
+        stats = self.dp.compute(limf, data_process=self.names, 
+                                data_process_cache_bypass=1)
+        for k, mf in enumerate(limf):
+            dfs = mf.dfs()
+            for n in self.names:
+                res = stats[n].iloc[:, k].loc[dfs.columns]
+                ref = dfs.apply(self.dp.processors[n])
+                np.testing.assert_allclose(res.values, ref.values, rtol=1e-10)
+    
+    def test_fit_once(self):
+        limf = [measfile.FlatFile(data.LIFNTRANSIENT[0]) for i in range(2)]
+        calls = []
+        fit_transients = techniques.fit_transients
+        def spy(model, I, t):
+            calls.append(model)
+            return fit_transients(model, I, t)
+        techniques.fit_transients = spy
+        try:
+            self.dp.compute(limf, data_process=self.names, 
+                            data_process_cache_bypass=1)
+        finally:
+            techniques.fit_transients = fit_transients
+        # One stack of the two files, fitted once for each model
+        self.assertEqual(calls, ['cottrell', 'exponential'])
+
+
 def debug():
     plab = PersistLabPlugins()
     plab.args_parser().print_help()
@@ -9,6 +9,15 @@ def main():
                     'transient = persistlabplugins.techniques:FigTransient',
                     'cv = persistlabplugins.techniques:FigCV' 
                     ]
+    parsers = ['cv = persistlabplugins.techniques:CVFile']
+    processors = ['cv.{0} = persistlabplugins.techniques:cv_{0}'.format(q)
+                  for q in ['epa', 'ipa', 'epc', 'ipc', 'qva', 'qvc', 
+                            'cycles']]
+    processors += ['transient.{0}.{1} = persistlabplugins.techniques:'
+                   'transient_{0}_{1}'.format(model, param) 
+                   for model, params in [('cottrell', ['k', 'exponent']), 
+                                    ('exponential', ['amplitude', 'tau'])] 
+                   for param in params + ['rms']]
     
     setup(name='persistlabplugins',
                     version='0.0', 
@@ -17,8 +26,8 @@ def main():
                     package_data = {'persistlabplugins':
                                     ['data/*.txt', 'data/*.csv']}, 
                     entry_points = {'plab_figure': figures, 
-                                    'plab_parser' : [], 
-                                    'plab_processor' : []}, 
+                                    'plab_parser' : parsers, 
+                                    'plab_processor' : processors}, 
                     scripts=[  'persistlabplugins_testall'], 
                                     )
 
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""
+    persistlab.archive
+    ~~~~~~~~~~~~~
+
+    This module opens the compressed data files and the archive members,
+    decompressed on the fly while they are read, without temporary files.
+
+    Compressed files end with ".gz", ".bz2" or ".xz", the latter needing
+    the lzma module (backports.lzma on Python 2). Archive members, of zip
+    or tar files, are named after the archive and their name in it,
+    e.g. "bundle.zip::run_012.txt", and decompressed too if their name 
+    ends with one of these extensions, e.g. "bundle.tar::run_012.txt.gz".
+
+    :copyright: 2013 Stephane Henry.
+    :license: BSD, see LICENSE for more details.
+"""
+
+import os
+import bz2
+import gzip
+import zlib
+import tarfile
+import zipfile
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+SEP_MEMBER = '::'
+
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2')
+
+def open_xz(fn):
+    if lzma is None:
+        raise IOError('the lzma module is needed to read "{}"'.format(fn))
+    return lzma.LZMAFile(fn)
+
+COMPRESSED = {'.gz':gzip.GzipFile, '.bz2':bz2.BZ2File, '.xz':open_xz}
+
+def xz_decompressor():
+    if lzma is None:
+        raise IOError('the lzma module is needed to read ".xz" members')
+    return lzma.LZMADecompressor()
+
+# Streaming decompressors of the compressed archive members
+DECOMPRESSORS = {'.gz':lambda: zlib.decompressobj(16 + zlib.MAX_WBITS), 
+                 '.bz2':bz2.BZ2Decompressor, 
+                 '.xz':xz_decompressor}
+
+def split(fn):
+    """return the path of the file holding fn and the name of the member,
+    or None if fn isn't an archive member"""
+    path, sep, member = fn.partition(SEP_MEMBER)
+    return path, member if sep else None
+
+def basename(fn):
+    path, member = split(fn)
+    return os.path.basename(member or path)
+
+def stat(fn):
+    """os.stat of the file holding fn"""
+    return os.stat(split(fn)[0])
+
+def is_archive(fn):
+    return fn.endswith('.zip') or fn.endswith(TAR_EXTENSIONS)
+
+def is_plain(fn):
+    """True if fn is a regular file, neither compressed nor archived"""
+    path, member = split(fn)
+    return member is None and not os.path.splitext(fn)[1] in COMPRESSED
+
+def members(fn):
+    """return the names of the files of the archive fn"""
+    if fn.endswith('.zip'):
+        with zipfile.ZipFile(fn) as zf:
+            names = [zi.filename for zi in zf.infolist()
+                     if not zi.filename.endswith('/')]
+    else:
+        with tarfile.open(fn) as tf:
+            names = [ti.name for ti in tf.getmembers() if ti.isfile()]
+    return [fn + SEP_MEMBER + name for name in names]
+
+def expand(lifn):
+    """return lifn with the archives replaced by their members"""
+    return [m for fn in lifn for m in (members(fn) if is_archive(fn) else [fn])]
+
+def open_data(fn):
+    """open the data file fn for reading"""
+    path, member = split(fn)
+    if member is not None:
+        return Member(fn)
+    return COMPRESSED.get(os.path.splitext(fn)[1], open)(fn)
+
+
+class Member(object):
+
+    """Archive member open for reading.
+
+    It can be positioned anywhere by seek, reading it forward,
+    from its start again if need be."""
+
+    blocksize = 2**20
+
+    def __init__(self, fn):
+        self.fn = fn
+        path, self.member = split(fn)
+        if path.endswith('.zip'):
+            self.archive = zipfile.ZipFile(path)
+        else:
+            self.archive = tarfile.open(path)
+        self._open()
+
+    def _open(self):
+        if isinstance(self.archive, zipfile.ZipFile):
+            self.fo = self.archive.open(self.member)
+        else:
+            self.fo = self.archive.extractfile(self.member)
+            if self.fo is None:
+                raise IOError('"{}" is not a file'.format(self.fn))
+        ext = os.path.splitext(self.member)[1]
+        if ext in DECOMPRESSORS:
+            self.fo = Decompressed(self.fo, DECOMPRESSORS[ext]())
+        self.pos = 0
+
+    def read(self, size=-1):
+        data = self.fo.read() if size < 0 else self.fo.read(size)
+        self.pos += len(data)
+        return data
+
+    def readline(self):
+        line = self.fo.readline()
+        self.pos += len(line)
+        return line
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            pos += self.pos
+        elif whence == os.SEEK_END:
+            self.read()
+            pos += self.pos
+        if pos < self.pos:
+            self.fo.close()
+            self._open()
+        while self.pos < pos and self.read(min(self.blocksize, pos-self.pos)):
+            pass
+
+    def close(self):
+        self.fo.close()
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Decompressed(object):
+
+    """Compressed file object, e.g. of an archive member, decompressed 
+    by the streaming decompressor while it is read forward"""
+
+    blocksize = 2**16
+
+    def __init__(self, fo, decompressor):
+        self.fo = fo
+        self.decompressor = decompressor
+        # Data decompressed, not read yet from offset
+        self.buf = ''
+        self.offset = 0
+
+    def _fill(self, size=-1):
+        """decompress data until size bytes, or all of them, can be read"""
+        if 0 <= size <= len(self.buf) - self.offset:
+            return
+        chunks = [self.buf[self.offset:]]
+        n = len(chunks[0])
+        while size < 0 or n < size:
+            data = self.fo.read(self.blocksize)
+            if not data:
+                break
+            chunks.append(self.decompressor.decompress(data))
+            n += len(chunks[-1])
+        self.buf = ''.join(chunks)
+        self.offset = 0
+
+    def read(self, size=-1):
+        self._fill(size)
+        end = len(self.buf)
+        if size >= 0:
+            end = min(self.offset + size, end)
+        data = self.buf[self.offset:end]
+        self.offset = end
+        return data
+
+    def readline(self):
+        i = self.buf.find('\n', self.offset)
+        while i < 0:
+            n = len(self.buf) - self.offset
+            self._fill(n + 1)
+            if len(self.buf) == n:
+                # The last line, without newline
+                return self.read()
+            i = self.buf.find('\n', n)
+        return self.read(i + 1 - self.offset)
+
+    def close(self):
+        self.fo.close()
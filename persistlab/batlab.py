@@ -32,13 +32,28 @@ import configobj
 import pandas
 
 import persist
+import archive
 import figitem
 import measfile
+import catalog
+import parsecache
+import incremental
+import resultcache
+import windowed
+import filters
 import publishrst
 from VERSION import __version__
 from fileutils import find_non_existing_dir as fned
 
 
+class StoreValues(argparse.Action):
+    
+    """Store the list of values, or the value if only one is given"""
+    
+    def __call__(self, parser, namespace, values, option_string=None):
+        setattr(namespace, self.dest, len(values) > 1 and values or values[0])
+
+
 class DefaultFigure(figitem.FigureManager):
     
     def __init__(self, *args, **kwargs):
@@ -75,9 +90,44 @@ class Settings:
         self.data_format='flat'
         self.data_channels=[-1]  
         self.data_segment_range = [-1]
+        self.data_segment_index = 0
+        self.data_jobs = 1
+        self.data_chunksize = 0
+        self.data_lazy = 0
+        self.data_follow = 0
+        # Numeric engine parsing the data
+        self.data_engine = 'auto'
+        self.data_dtype = 'float64'
+        self.data_engine_benchmark = 0
+        # Header metadata catalog
+        self.data_select = []
+        # Empty for the default file in the cache directory
+        self.data_catalog = ''
+        # Parse cache
+        # Empty for the default directory, see parsecache.cache_path
+        self.data_cache_dir = ''
+        self.data_cache_size = 512
+        self.data_cache_bypass = 0
+        self.data_cache_clear = 0
         # Data processing
         self.data_process=''
         self.data_process_fn='stats.csv'
+        self.data_process_segments = 0
+        self.data_process_jobs = 1
+        self.data_process_batch = 0
+        # Preprocessing filters
+        self.data_filters = []
+        # Windowed processors
+        self.data_derive = ''
+        self.data_window = 11
+        self.data_threshold = 0.
+        # Processing results cache
+        # Empty for the default file in the cache directory
+        self.data_process_cache = ''
+        self.data_process_cache_age = 30
+        self.data_process_cache_size = 64
+        self.data_process_cache_bypass = 0
+        self.data_process_cache_clear = 0
         # Plotting
         self.figure_write=0
         self.figure_plot = 0
@@ -93,6 +143,7 @@ class Settings:
         # General output
         self.output_dir='output'
         self.output_overwrite=0
+        self.output_incremental=0
         # Report
         self.publish = 0
         self.publish_float_format='%.2e'
@@ -142,12 +193,16 @@ class Plotter(object):
         """one file per figure"""
         lifm = []
         for mf in limf:
+            loaded = mf.is_loaded()
             fm = self.make_fm(bn_fig='fig_' + mf.bn, **kwargs)
+            fm.limf = [mf]
             lifm.append(fm)
             for i, s in enumerate(mf):
                 ll = self.legend_label(s.name)
                 fm.plot_series(series=s, i=i, legend_label=ll, **kwargs)
             fm.adorn(**kwargs)
+            # Free the data loaded for this figure, e.g. of lazy files
+            loaded or mf.release()
         return lifm
     
     def _legend_label_a(self, mf, series):
@@ -157,6 +212,7 @@ class Plotter(object):
         """all files in one figure"""
         cp = self.common_prefix(limf)
         fm = self.make_fm(bn_fig='fig_' + cp, **kwargs)
+        fm.limf = limf
         i = 0
         for mf in limf:
             for series in mf:
@@ -194,6 +250,17 @@ class Plotter(object):
     
     def visualise(self, limf, figure_mode='a', **kwargs):
         return getattr(self, 'visualise_' + figure_mode)(limf, **kwargs)
+    
+    def update(self, lifm):
+        """update in place the lines of the figures of the modes "o" and "a" 
+        with the rows appended to their files, return the number of new rows"""
+        nrows = 0
+        for fm in lifm:
+            linew = [mf.update() for mf in fm.limf]
+            if any(linew):
+                fm.update_lines([s for mf in fm.limf for s in mf])
+            nrows += sum(linew)
+        return nrows
 
 
 class InteractivePlotter(Plotter):
@@ -328,29 +395,106 @@ class PersistLab(object):
             # over the parameters potentially loaded  from a settings file
             self.params.update(kwargs)
         
-        # Choose output directory
-        if not output_overwrite:
+        # Check the parameters before any file is parsed
+        try:
+            self.check_params()
+        except ValueError as err:
+            if not clargs:
+                raise
+            self.args_parser().error(str(err))
+        
+        # Choose output directory, kept across the incremental runs
+        if not (output_overwrite or self.params.output_incremental):
             self.params.output_dir = fned(self.params.output_dir)
         # Update settings manager properties
         self.sm.verbose = self.params.verbose
         self.sm.fn = self.params.output_dir + '.ini'
         
     
+    def check_params(self):
+        """raise ValueError if the predicates selecting the files, the window 
+        of the windowed processors or the filters are invalid, or if the 
+        files can't be followed"""
+        params = self.params
+        if params.data_follow and params.figure_plot:
+            # Lazy files release their data, and only the figures shown 
+            # are closed
+            if params.data_lazy:
+                raise ValueError('lazy files can not be followed')
+            if not params.figure_show:
+                raise ValueError('files can only be followed with the '
+                                 'figures shown')
+        for predicate in measfile.listify(params.data_select):
+            catalog.parse_predicate(predicate)
+        for name in [params.data_derive] + measfile.listify(
+                                                    params.data_process):
+            if name in windowed.PROCESSORS:
+                windowed.Processor(name, params.data_window)
+        filters.FilterChain(params.data_filters).filters()
+    
     def data_plot(self):
+        limf = self.limf
+        if self.incremental and self.params.figure_mode != 'o':
+            # Figures of all the files, drawn again when one of them changed
+            # or was removed
+            changed = limf or self.incremental.removed
+            limf = changed and self.dataparser.parse_files(**self.params()) \
+                    or []
+            self.params.data_filters and filters.apply_filters(limf, 
+                                                        **self.params())
+            self.params.data_derive and self.dataproc.derive(limf, 
+                                                        **self.params())
 ##        lifm = self.plotter.visualise(plab=self, limf=self.limf, 
-        lifm = self.plotter.visualise(limf=self.limf, 
+        lifm = limf and self.plotter.visualise(limf=limf, 
 ##                        figure_items = self.figure_items, 
-                        **vars(self.params))
+                        **vars(self.params)) or []
+        self.lifm = lifm
         if self.params.figure_write:
             self.plotter.write_figures(lifm, **vars(self.params))
             libn = [fm.bn_fig for fm in lifm]
+            if self.incremental:
+                libn = self.incremental.merge_figures(libn, 
+                                                self.params.figure_mode)
             if self.params.publish:
                 self.publisher.add_figures(libn, **vars(self.params))
-        self.params.figure_show and pyplot.show()
+        # Followed files are shown by data_follow
+        follow = self.params.data_follow
+        self.params.figure_show and not follow and pyplot.show()
+    
+    def data_benchmark(self):
+        """print the rows parsed per second by each numeric engine in the 
+        data files, and use the fastest one, kept in the settings file"""
+        rates = self.dataparser.benchmark_engines(**self.params())
+        if rates.empty:
+            return
+        print (rates.to_string(float_format=lambda v: '{:.3g}'.format(v)))
+        median = rates.median(axis=1)
+        if median.isnull().all():
+            print ('no engine parsed the data files')
+            return
+        self.params.data_engine = median.idxmax()
+        print ('fastest engine: {}'.format(self.params.data_engine))
+    
+    def data_follow(self):
+        """update the figures with the rows appended to their files, 
+        every data_follow seconds until the figures are closed"""
+        if self.params.figure_mode == 's':
+            print ('files can not be followed with the figure mode "s"')
+            return
+        while pyplot.get_fignums():
+            pyplot.pause(self.params.data_follow)
+            nrows = self.plotter.update(self.lifm)
+            TXT = 'appended {} rows'
+            self.params.verbose and nrows and print (TXT.format(nrows))
     
     def data_process(self):
-        stats_df = self.dataproc.compute(limf=self.limf, **self.params.__dict__)
-        u = self.params.publish
+        stats_df = None
+        if self.limf:
+            stats_df = self.dataproc.compute(limf=self.limf, 
+                                             **self.params.__dict__)
+        if self.incremental:
+            stats_df = self.incremental.merge_stats(stats_df)
+        u = self.params.publish and stats_df is not None
         u and self.publisher.add_dataframe(stats_df, **self.params.__dict__)
 
     def args_parser(self):
@@ -371,7 +515,10 @@ class PersistLab(object):
                         default = self.params.data_files, 
                         type = os.path.relpath, 
                         metavar='FILE',
-                        help="data file(s) to be processed.")
+                        help=("data file(s) to be processed, possibly "
+                              "compressed (.gz, .bz2, .xz), archives (.zip, "
+                              ".tar) or archive members "
+                              "(e.g. bundle.zip::run_012.txt)."))
         
         #  OPTIONAL ARGUMENTS #
         # General #
@@ -393,16 +540,86 @@ class PersistLab(object):
                         default=self.params.data_channels, 
                         type=int, 
                         metavar = 'N', 
-                        help='channel(s) to plot, "-1" plots all.')
+                        help='channel(s) to parse and plot, "-1" for all.')
         parser.add_argument('-p', '--data-process',  
 ##                        choices=self.dataproc.calculators.keys(), 
                         # The choices are not limited here
                         # to be able to accept numpy universal functions,
                         # e.g. numpy.add, ...
-                        action = 'store', 
+                        action = StoreValues, 
 ##                        nargs=1, 
+                        nargs='+', 
                         default=self.params.data_process, 
-                        help='data processing type.')
+                        help=('data processing type(s), all computed in '
+                              'one pass over the data.'))
+        parser.add_argument('--data-process-segments', 
+                        action='store_true', 
+                        help=('compute the processors for each segment of '
+                              'the multiple segment data files.'))
+        parser.add_argument('--data-filters', 
+                        nargs='+', 
+                        default=self.params.data_filters, 
+                        metavar='FILTER', 
+                        help=('chain of filters applied in turn to the '
+                              'selected channels before they are processed '
+                              'and plotted: scale:FACTOR[,OFFSET], '
+                              'baseline[:ROWS], smooth[:ROWS] and '
+                              'resample:ROWS, e.g. "baseline:10 scale:1e6".'))
+        parser.add_argument('--data-derive', 
+                        choices=windowed.PROCESSORS.keys(), 
+                        default=self.params.data_derive, 
+                        help=('replace the selected channels by the channels '
+                              'derived by a windowed processor, before they '
+                              'are processed and plotted.'))
+        parser.add_argument('--data-window', 
+                        type=int, 
+                        metavar='SAMPLES', 
+                        default=self.params.data_window, 
+                        help=('window length of the windowed processors ('
+                              '{}).'.format(', '.join(windowed.PROCESSORS))))
+        parser.add_argument('--data-threshold', 
+                        type=float, 
+                        default=self.params.data_threshold, 
+                        help='threshold of the crossings processor.')
+        parser.add_argument('--data-process-jobs', 
+                        type=int, 
+                        metavar='N', 
+                        default=self.params.data_process_jobs, 
+                        help=('number of processes applying the processors '
+                              'to the channels of the data files, '
+                              '"0" uses one per cpu.'))
+        parser.add_argument('--data-process-batch', 
+                        type=int, 
+                        metavar='TASKS', 
+                        default=self.params.data_process_batch, 
+                        help=('channels handed at once to each processing '
+                              'process, "0" chooses it from their number.'))
+        parser.add_argument('--data-process-cache', 
+                        metavar='FILE', 
+                        default=self.params.data_process_cache, 
+                        help=('processing results cache (SQLite) file, '
+                              'the results of the unchanged files '
+                              'being read from it, in the cache directory '
+                              'by default.'))
+        parser.add_argument('--data-process-cache-age', 
+                        type=float, 
+                        metavar='DAYS', 
+                        default=self.params.data_process_cache_age, 
+                        help=('evict the results unused for DAYS from '
+                              'the processing results cache.'))
+        parser.add_argument('--data-process-cache-size', 
+                        type=float, 
+                        metavar='MB', 
+                        default=self.params.data_process_cache_size, 
+                        help=('processing results cache size cap, the least '
+                              'recently used results are evicted beyond it.'))
+        parser.add_argument('--data-process-cache-bypass', 
+                        action='store_true', 
+                        help='neither read nor write the results cache.')
+        parser.add_argument('--data-process-cache-clear', 
+                        action='store_true', 
+                        help=('invalidate the processing results cache '
+                              'before processing.'))
         
         parser.add_argument('-r', '--data-segment-range', 
                         nargs=2,
@@ -413,6 +630,80 @@ class PersistLab(object):
                         help=('segment start and stop, "-1" means all of them.'
                               ' Only valid for multiple segment data file.'))
         
+        parser.add_argument('-j', '--data-jobs', 
+                        type=int, 
+                        metavar='N', 
+                        default=self.params.data_jobs, 
+                        help=('number of processes parsing the data files, '
+                              '"0" uses one per cpu.'))
+        parser.add_argument('-z', '--data-chunksize', 
+                        type=int, 
+                        metavar='ROWS', 
+                        default=self.params.data_chunksize, 
+                        help=('stream the data files by chunks of ROWS rows '
+                              'for the processing, "0" loads them whole.'))
+        parser.add_argument('-dl', '--data-lazy', 
+                        action='store_true', 
+                        help=('only parse the headers of the data files, '
+                              'the data is parsed when needed.'))
+        parser.add_argument('--data-follow', 
+                        type=float, 
+                        metavar='SECONDS', 
+                        default=self.params.data_follow, 
+                        help=('follow the data files still written, '
+                              'updating the figures every SECONDS '
+                              'with the rows appended.'))
+        parser.add_argument('--data-engine', 
+                        choices=['auto'] + measfile.ENGINES.keys(), 
+                        default=self.params.data_engine, 
+                        help='numeric engine parsing the data.')
+        parser.add_argument('--data-dtype', 
+                        choices=['float64', 'float32'], 
+                        default=self.params.data_dtype, 
+                        help=('storage type of the data, float32 halves '
+                              'its memory.'))
+        parser.add_argument('--data-engine-benchmark', 
+                        action='store_true', 
+                        help=('print the rows parsed per second by each '
+                              'numeric engine in the data files and use '
+                              'the fastest one.'))
+        parser.add_argument('-q', '--data-select', 
+                        nargs='+', 
+                        default=self.params.data_select, 
+                        metavar='PRED', 
+                        help=('only process the data files whose header '
+                              'match all the predicates, '
+                              'e.g. "Scan Rate (V/s) > 0.05".'))
+        parser.add_argument('--data-catalog', 
+                        metavar='FILE', 
+                        default=self.params.data_catalog, 
+                        help=('header metadata catalog (SQLite) file, '
+                              'in the cache directory by default.'))
+        parser.add_argument('-cb', '--data-cache-bypass', 
+                        action='store_true', 
+                        help='neither read nor write the parse cache.')
+        parser.add_argument('-cc', '--data-cache-clear', 
+                        action='store_true', 
+                        help='clear the parse cache before parsing.')
+        parser.add_argument('--data-cache-dir', 
+                        metavar='DIR', 
+                        default=self.params.data_cache_dir, 
+                        help=('parse cache directory, by default '
+                              '$PERSISTLAB_CACHE_DIR or ~/.cache/persistlab.'))
+        parser.add_argument('--data-cache-size', 
+                        type=int, 
+                        metavar='MB', 
+                        default=self.params.data_cache_size, 
+                        help=('parse cache size cap, the least recently used '
+                              'files are evicted beyond it.'))
+        
+        parser.add_argument('-si', '--data-segment-index', 
+                        action='store_true', 
+                        help=('keep the header and the segment offsets of '
+                              'multiple segment data files in sidecar index '
+                              'files, to parse only the selected segments '
+                              'when they are opened again.'))
+        
         # Visualisation #
         parser.add_argument('-f', '--figure-plot', 
                             action='store_true', 
@@ -482,6 +773,10 @@ class PersistLab(object):
         parser.add_argument('-oo', '--output-overwrite', 
                         action='store_true', 
                         help='overwrite the output directory.')
+        parser.add_argument('-oi', '--output-incremental', 
+                        action='store_true', 
+                        help='reuse the output directory and process only '
+                        'the files new or changed since the last run.')
         
         # Document publishing #
         parser.add_argument('-u', '--publish', 
@@ -500,14 +795,33 @@ class PersistLab(object):
     def exec_kwargs(self, **kwargs):
         # Arange the parameters    
         self.config_setup(**kwargs)
-        # Parse data
-        self.limf = self.dataparser.parse_files(**self.params())
+        self.params.data_engine_benchmark and self.data_benchmark()
+        # Parse data, only the new or changed files in incremental mode
+        lifn = archive.expand(self.params.data_files)
+        self.incremental = None
+        if self.params.output_incremental:
+            self.incremental = incremental.IncrementalState(**self.params())
+            lifn = self.incremental.changed(lifn)
+        self.limf = self.dataparser.parse_files(**dict(self.params(), 
+                                                       data_files=lifn))
+        # Filtered and derived channels, processed and plotted instead of 
+        # the data
+        self.params.data_filters and filters.apply_filters(self.limf, 
+                                                           **self.params())
+        self.params.data_derive and self.dataproc.derive(self.limf, 
+                                                         **self.params())
         # Process data
         self.params.data_process and self.data_process()
         # Plot
         self.params.figure_plot and self.data_plot()
+        # Follow the files still written
+        u = self.params.figure_plot and self.params.data_follow
+        u and self.data_follow()
         # Publish document
         self.params.publish and self.publisher.publish(**self.params())
+        if self.incremental:
+            self.incremental.done([mf.fn for mf in self.limf])
+            self.incremental.write()
         # Write config
         self.params.config_write and self.config_write()
 
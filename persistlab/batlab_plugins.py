@@ -25,6 +25,10 @@ class PersistLabPlugins(batlab.PersistLab):
             except:
                 print "error loading plugins " + str(ep)
             self.plugins_versions[ep.dist.project_name] = ep.dist.version
+            if container is self.dataproc.processors:
+                # Their cached results are only valid for this version
+                version = '{} {}'.format(ep.dist.project_name, ep.dist.version)
+                self.dataproc.versions[ep.name] = version
     
     def populate_settings(self):
         super(PersistLabPlugins, self).populate_settings()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""
+    persistlab.catalog
+    ~~~~~~~~~~~~~
+
+    This module implements a catalog of the data files header metadata.
+
+    The "key = value" lines of the headers, e.g. "Scan Rate (V/s) = 0.1"
+    in CHI exports, are stored in a SQLite database indexed by key, so
+    files can be selected on their metadata without parsing their data.
+
+    :copyright: 2013 Stephane Henry.
+    :license: BSD, see LICENSE for more details.
+"""
+
+from __future__ import print_function
+
+import os
+import re
+import sqlite3
+from collections import OrderedDict
+
+import archive
+import parsecache
+
+# Catalog file in the cache directory, by default
+CATALOG_BN = 'catalog.sqlite'
+
+# "key = value" or "key: value" header lines
+RE_FIELD = re.compile(r'^\s*([A-Za-z][\w ./()%-]*?)\s*[=:]\s*(.*?)\s*$')
+
+# Predicates such as "Scan Rate (V/s) > 0.05"
+RE_PREDICATE = re.compile(r'^\s*(.+?)\s*(<=|>=|==|!=|=|<|>)\s*(.*?)\s*$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE,
+    size INTEGER,
+    mtime REAL);
+CREATE TABLE IF NOT EXISTS fields (
+    file_id INTEGER,
+    key TEXT,
+    num REAL,
+    text TEXT);
+CREATE INDEX IF NOT EXISTS fields_num ON fields (key, num);
+CREATE INDEX IF NOT EXISTS fields_text ON fields (key, text);
+CREATE INDEX IF NOT EXISTS fields_file ON fields (file_id);
+"""
+
+def to_number(str_value):
+    """return the value as an int or a float, or None if it is not a number"""
+    for t in (int, float):
+        try:
+            return t(str_value)
+        except ValueError:
+            pass
+    return None
+
+def to_text(value):
+    if isinstance(value, str):
+        return value.decode('utf-8', 'replace')
+    return unicode(value)
+
+def parse_metadata(liheader):
+    """return the ordered dictionary of the typed values of the header lines,
+    the first value being kept for repeated keys"""
+    metadata = OrderedDict()
+    for line in liheader:
+        m = RE_FIELD.match(line)
+        if not m or not m.group(2) or m.group(1) in metadata:
+            continue
+        v = to_number(m.group(2))
+        metadata[m.group(1)] = m.group(2) if v is None else v
+    return metadata
+
+def parse_predicate(str_predicate):
+    """return the key, the operator and the value of a predicate"""
+    m = RE_PREDICATE.match(str_predicate)
+    if not m:
+        raise ValueError('invalid predicate "{}"'.format(str_predicate))
+    key, op, value = m.groups()
+    v = to_number(value)
+    return key, op, value if v is None else v
+
+
+class HeaderCatalog:
+
+    """SQLite catalog of the metadata of the data file headers"""
+
+    def __init__(self, fn=None, verbose=0):
+        self.fn = fn or parsecache.cache_path(CATALOG_BN)
+        self.verbose = verbose
+        d = os.path.dirname(self.fn)
+        d and not os.path.isdir(d) and os.makedirs(d)
+        self.db = sqlite3.connect(self.fn)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def update(self, lifn, DFF):
+        """Catalog the files that are new or changed since they were
+        cataloged, parsing only their header with the file class DFF"""
+        known = dict((path, (size, mtime)) for path, size, mtime in
+                     self.db.execute('SELECT path, size, mtime FROM files'))
+        with self.db:
+            for fn in lifn:
+                path = to_text(os.path.abspath(fn))
+                st = archive.stat(fn)
+                if known.get(path) == (st.st_size, st.st_mtime):
+                    continue
+                try:
+                    metadata = DFF(fn, data_lazy=1).metadata()
+                except Exception as er:
+                    print ('error cataloging {}: {}'.format(fn, er))
+                    continue
+                self.add(path, st, metadata)
+
+    def add(self, path, st, metadata):
+        """Store the metadata of the file at path, replacing any former one"""
+        for (file_id,) in self.db.execute(
+                        'SELECT id FROM files WHERE path = ?', (path,)):
+            self.db.execute('DELETE FROM fields WHERE file_id = ?',(file_id,))
+        self.db.execute('DELETE FROM files WHERE path = ?', (path,))
+        cur = self.db.execute(
+                        'INSERT INTO files (path, size, mtime) VALUES (?,?,?)',
+                        (path, st.st_size, st.st_mtime))
+        rows = [(cur.lastrowid, to_text(k),
+                 None if isinstance(v, basestring) else v, to_text(v))
+                for k, v in metadata.items()]
+        self.db.executemany('INSERT INTO fields VALUES (?, ?, ?, ?)', rows)
+
+    def query(self, str_predicate):
+        """return the set of the paths of the files matching the predicate.
+
+        Numbers are compared with the numeric values, other values with
+        the text ones."""
+        key, op, value = parse_predicate(str_predicate)
+        column = isinstance(value, basestring) and 'text' or 'num'
+        sql_op = op == '==' and '=' or op
+        sql = ('SELECT path FROM files JOIN fields ON files.id = file_id '
+               'WHERE key = ? AND {} {} ?'.format(column, sql_op))
+        if column == 'text':
+            value = to_text(value)
+        lirows = self.db.execute(sql, (to_text(key), value))
+        return set(path for (path,) in lirows)
+
+    def select(self, lifn, lipredicates):
+        """return the files of lifn matching all the predicates"""
+        paths = None
+        for p in lipredicates:
+            res = self.query(p)
+            paths = res if paths is None else paths & res
+        if paths is None:
+            return list(lifn)
+        return [fn for fn in lifn if to_text(os.path.abspath(fn)) in paths]
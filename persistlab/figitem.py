@@ -293,6 +293,7 @@ class FigureManager(object):
         self.bn_fig = bn_fig
         
         # Lines properties
+        self.lines = []
         self._colors = colors
         self._markers = markers
         self._line_styles = line_styles
@@ -377,6 +378,8 @@ class FigureManager(object):
         # plot line
         lines = series.plot(ax=ax, color=col, linestyle=ls, marker=m, 
                             label=legend_label,  **plt_kwargs)
+        # Keep the line to update its data in place
+        self.lines.append(ax.get_lines()[-1])
         # Show/hide the legend
         ax.legend().set_visible(figure_show_legend)
         
@@ -384,6 +387,20 @@ class FigureManager(object):
         from matplotlib.ticker import ScalarFormatter
         ax.xaxis.set_major_formatter(ScalarFormatter())
     
+    def update_lines(self, liseries):
+        """Set the data of the lines plotted, in the same order, to the 
+        series of liseries, without drawing the figure again."""
+        for line, series in zip(self.lines, liseries):
+            self.set_line_data(line, series)
+        for ax in self.figure.axes:
+            ax.relim()
+            ax.autoscale_view()
+        self.figure.canvas.draw_idle()
+    
+    def set_line_data(self, line, series):
+        """Set the data of the line plotted to the series"""
+        line.set_data(series.index.values, series.values)
+    
     # Figure items
     def print_item_val(self, item):
         print "{} : {}".format(item.str_item, item.get())
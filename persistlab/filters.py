@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+"""
+    persistlab.filters
+    ~~~~~~~~~~~~~
+
+    This module implements the preprocessing filters of the data: unit
+    scaling, baseline subtraction, smoothing and resampling.
+
+    The filters of a chain, e.g. ['baseline:10', 'scale:1e6', 'smooth:5'],
+    are applied in turn to the selected channels of each parsed file,
+    replacing its data, before it is processed and plotted, so no
+    intermediate file is written nor parsed again. The data is fed chunk
+    by chunk, each filter keeping the rows it needs from a chunk to the
+    next, so a streamed file gives the same data as a loaded one.
+
+    :copyright: 2013 Stephane Henry.
+    :license: BSD, see LICENSE for more details.
+"""
+
+import numpy
+import pandas
+
+import windowed
+
+
+def rows(value, name):
+    """return the number of rows value, e.g. '10', of the filter name"""
+    n = int(value)
+    if n < 1:
+        raise ValueError('the filter {} needs 1 row or more, not {}'.format(
+                                                                    name, n))
+    return n
+
+
+class Filter(object):
+
+    """Filter of the data given chunk of rows by chunk of rows: update
+    returns the filtered rows of a chunk, finish those of the rows kept
+    for the next chunks"""
+
+    def update(self, df):
+        return df
+
+    def finish(self):
+        return None
+
+
+class Scale(Filter):
+
+    """scale:FACTOR[,OFFSET], the values times FACTOR plus OFFSET"""
+
+    def __init__(self, factor, offset=0.):
+        self.factor = float(factor)
+        self.offset = float(offset)
+
+    def update(self, df):
+        return df * self.factor + self.offset
+
+
+class Baseline(Filter):
+
+    """baseline[:ROWS], the values minus the mean of the first ROWS rows
+    of their channel, Nan values skipped"""
+
+    def __init__(self, n=1):
+        self.rows = rows(n, 'baseline')
+        self.baseline = None
+        # Rows waiting for the baseline
+        self.pending = []
+
+    def update(self, df):
+        if self.baseline is not None:
+            return df - self.baseline
+        self.pending.append(df)
+        if sum(len(d) for d in self.pending) < self.rows:
+            return None
+        return self.finish()
+
+    def finish(self):
+        if not self.pending:
+            return None
+        df = pandas.concat(self.pending)
+        self.pending = []
+        self.baseline = df.iloc[:self.rows].mean()
+        return df - self.baseline
+
+
+class Derive(Filter):
+
+    """The channels derived by the windowed processor, see 
+    windowed.Processor"""
+
+    def __init__(self, processor):
+        self.reduction = processor.reduction()
+
+    def update(self, df):
+        return self.reduction.derive(df)
+
+    def finish(self):
+        return self.reduction.finish()
+
+
+class Smooth(Derive):
+
+    """smooth[:ROWS], the centered rolling mean of ROWS rows, Nan for the
+    rows too close to the ends"""
+
+    def __init__(self, window=5):
+        Derive.__init__(self, windowed.Processor('rolling.mean', 
+                                            window=rows(window, 'smooth')))
+
+
+class Resample(Filter):
+
+    """resample:ROWS, the means of the values and of the index of the
+    blocks of ROWS rows"""
+
+    def __init__(self, n):
+        self.rows = rows(n, 'resample')
+        # Rows of the incomplete block
+        self.pending = None
+
+    def update(self, df):
+        if self.pending is not None:
+            df = pandas.concat([self.pending, df])
+        n = len(df) - len(df) % self.rows
+        self.pending = df.iloc[n:]
+        return self._means(df.iloc[:n])
+
+    def finish(self):
+        df, self.pending = self.pending, None
+        if df is None or not len(df):
+            return None
+        return self._means(df)
+
+    def _means(self, df):
+        n = -(-len(df) // self.rows)
+        starts = numpy.arange(n) * self.rows
+        counts = numpy.minimum(self.rows, len(df) - starts)
+        if not n:
+            return df
+        index = numpy.add.reduceat(df.index.values.astype(float), 
+                                   starts) / counts
+        values = numpy.add.reduceat(df.values, starts, axis=0) / \
+                 counts[:, None]
+        return pandas.DataFrame(values, index=index, columns=df.columns)
+
+# Name: filter class
+FILTERS = {'scale':Scale,
+           'baseline':Baseline,
+           'smooth':Smooth,
+           'resample':Resample}
+
+def iter_filtered(lif, chunks, finish=True):
+    """iterate over the chunks of the iterable chunks filtered by the 
+    filters lif in turn, then, with finish, over the rows they kept"""
+    for df in chunks:
+        df = _update(lif, df)
+        if df is not None:
+            yield df
+    if not finish:
+        # e.g. the rows of a followed file, more rows being appended
+        return
+    # The rows kept by a filter go through the next ones
+    for i, f in enumerate(lif):
+        df = f.finish()
+        if df is not None:
+            df = _update(lif[i+1:], df)
+        if df is not None:
+            yield df
+
+def _update(lif, df):
+    for f in lif:
+        df = f.update(df)
+        if df is None:
+            return None
+    return df
+
+def parse(spec):
+    """return the name and the arguments of the filter spec,
+    e.g. 'scale:1e6,0.5'"""
+    name, sep, args = spec.partition(':')
+    if not name in FILTERS:
+        raise ValueError('unknown filter "{}", one of {}'.format(name,
+                                                ', '.join(sorted(FILTERS))))
+    return name, [a for a in args.split(',') if a]
+
+
+class FilterChain:
+
+    """Chain of the filters given by their specs, applied in turn, a stage 
+    of the data files, see measfile.FlatFile.add_stage"""
+
+    def __init__(self, specs):
+        self.specs = [s for s in specs if s]
+        self.parsed = [parse(s) for s in self.specs]
+
+    def filters(self):
+        """return new filters, one chain per file, raise ValueError if 
+        the arguments of a filter are invalid"""
+        lif = []
+        for spec, (name, args) in zip(self.specs, self.parsed):
+            try:
+                lif.append(FILTERS[name](*args))
+            except (TypeError, ValueError) as err:
+                raise ValueError('invalid filter "{}": {}'.format(spec, err))
+        return lif
+
+    def step(self):
+        """return the number of rows giving one filtered row"""
+        return numpy.prod([int(args[0]) for name, args in self.parsed
+                           if name == 'resample'] or [1])
+
+    def iter_filtered(self, chunks):
+        """iterate over the filtered chunks of the iterable chunks"""
+        return iter_filtered(self.filters(), chunks)
+
+    def __str__(self):
+        return ' '.join(self.specs)
+
+
+class Derivation:
+
+    """Stage of the channels derived by the windowed processor, see 
+    measfile.FlatFile.add_stage"""
+
+    def __init__(self, processor):
+        self.processor = processor
+
+    def filters(self):
+        return [Derive(self.processor)]
+
+    def step(self):
+        return 1
+
+def apply_filters(limf, data_filters=[], **kwargs):
+    """replace the selected channels of the files by the channels filtered
+    by the chain data_filters, a stage of the files: the loaded data is 
+    filtered at once, the other data when it is loaded or, chunk by chunk, 
+    streamed, see measfile.FlatFile.add_stage.
+
+    The filtered channels keep the names and the channels of the original
+    ones, and the segments of the rows of the multiple segment files
+    follow the resampling."""
+    chain = FilterChain(data_filters)
+    if not chain.specs:
+        return
+    for mf in limf:
+        mf.add_stage(chain)
+        mf.filtered = str(chain)
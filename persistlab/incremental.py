@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+    persistlab.incremental
+    ~~~~~~~~~~~~~
+
+    This module keeps track, in the output directory, of the data files
+    processed by the previous runs, so only the new or changed files are
+    parsed, processed and plotted again.
+
+    :copyright: 2013 Stephane Henry.
+    :license: BSD, see LICENSE for more details.
+"""
+
+from __future__ import print_function
+
+import os
+import json
+
+import pandas
+
+import archive
+
+FN_STATE = '.incremental.json'
+FN_STATS = '.incremental_stats.pkl'
+
+# Settings changing the results of a file, which are all computed again
+# when one of them changes
+SIGNATURE_KEYS = ['data_format', 'data_channels', 'data_segment_range',
+                  'data_select', 'data_process', 'data_process_segments',
+                  'data_filters', 'data_derive', 'data_window', 
+                  'data_threshold',
+                  'figure_mode', 'figure_type']
+
+def fingerprint(fn):
+    st = archive.stat(fn)
+    return [st.st_size, st.st_mtime]
+
+
+class IncrementalState:
+
+    """Fingerprints of the data files, processing results and figures
+    of the previous runs"""
+
+    def __init__(self, output_dir='output', verbose=0, **kwargs):
+        self.dn = output_dir
+        self.verbose = verbose
+        self.signature = [repr(kwargs.get(k)) for k in SIGNATURE_KEYS]
+        self.fingerprints = {}
+        self.figures = []
+        self.stats = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(os.path.join(self.dn, FN_STATE)) as fo:
+                state = json.load(fo)
+        except (IOError, ValueError):
+            return
+        if state['signature'] != self.signature:
+            self.verbose and print ('settings changed, processing all files')
+            return
+        self.fingerprints = state['fingerprints']
+        self.figures = state['figures']
+        fn_stats = os.path.join(self.dn, FN_STATS)
+        if os.path.isfile(fn_stats):
+            self.stats = pandas.read_pickle(fn_stats)
+
+    def write(self):
+        not os.path.isdir(self.dn) and os.makedirs(self.dn)
+        state = dict(signature=self.signature,
+                     fingerprints=self.fingerprints,
+                     figures=self.figures)
+        with open(os.path.join(self.dn, FN_STATE), 'w') as fo:
+            json.dump(state, fo)
+        if self.stats is not None:
+            self.stats.to_pickle(os.path.join(self.dn, FN_STATS))
+
+    def changed(self, lifn):
+        """return the files of lifn that are new or changed since the last
+        run, and forget the files not in lifn anymore"""
+        lipath = [os.path.abspath(fn) for fn in lifn]
+        self.removed = [p for p in self.fingerprints if p not in lipath]
+        self.modified = [fn for fn, p in zip(lifn, lipath)
+                         if self.fingerprints.get(p) != fingerprint(fn)]
+        self.verbose and print ('{} new or changed file(s), {} removed'.format(
+                                len(self.modified), len(self.removed)))
+        return self.modified
+
+    def done(self, parsed=None):
+        """record the fingerprints of the files processed by this run, only
+        the files of parsed if given, so that the files that failed to
+        parse are parsed again by the next run"""
+        for p in self.removed:
+            del self.fingerprints[p]
+        lipath = parsed is not None and \
+                    [os.path.abspath(fn) for fn in parsed]
+        for fn in self.modified:
+            p = os.path.abspath(fn)
+            if parsed is None or p in lipath:
+                self.fingerprints[p] = fingerprint(fn)
+            else:
+                self.fingerprints.pop(p, None)
+
+    def stale_names(self):
+        """basenames of the files whose results are out of date"""
+        return [archive.basename(p) for p in self.removed] + \
+                [archive.basename(fn) for fn in self.modified]
+
+    def merge_stats(self, df_stats):
+        """return the statistics of the previous runs updated with df_stats,
+        the statistics of the new or changed files"""
+        if self.stats is not None:
+            # The files are the last level of the columns
+            names = self.stats.columns.get_level_values(-1)
+            old = self.stats.loc[:, ~names.isin(self.stale_names())]
+            lidf = [df for df in [old, df_stats] if df is not None]
+            df_stats = pandas.concat(lidf, axis=1)
+            if df_stats.columns.nlevels > 1:
+                # Group the files by processor
+                df_stats = df_stats.sortlevel(0, axis=1, sort_remaining=False)
+        self.stats = df_stats
+        return df_stats
+
+    def merge_figures(self, libn, figure_mode='a'):
+        """return the basenames of the figures of the previous runs updated
+        with libn, the basenames of the figures drawn by this run"""
+        if figure_mode == 'o':
+            stale = ['fig_' + bn for bn in self.stale_names()]
+            self.figures = [bn for bn in self.figures if not bn in stale]
+        elif libn or self.removed:
+            # The figures gather all the files
+            self.figures = []
+        self.figures += [bn for bn in libn if not bn in self.figures]
+        return self.figures
@@ -11,16 +11,42 @@
 
 from __future__ import print_function
 
+import io
 import os
 import re
 import csv
+import json
+import mmap
+import shutil
+import cStringIO
+import time
+import warnings
+import tempfile
+import multiprocessing
+from collections import OrderedDict
 
 import pandas 
 import numpy
 
+import archive
+import catalog
+import parsecache
+import resultcache
+import windowed
+import filters
+from VERSION import __version__
+
 #The regular expression ``[+-]?(\d+(\.\d*)?|\.\d+)`` matches
 #floating-point numbers (without exponents).
 REGEX_FLOAT = "[-+]?[0-9]*\.?[0-9]+"
+RE_FLOAT = re.compile(REGEX_FLOAT)
+
+# Start of a segment in multiple segment files
+RE_SEGMENT = re.compile(r'^Segment \d+:[^\n]*$', re.MULTILINE)
+
+# Segment index files
+SUFFIX_SIDECAR = '.segidx'
+SIDECAR_FORMAT = 2
 
 def listify(obj):
     """listify(object) -- return object, listified if it is not iterable"""
@@ -28,8 +54,8 @@ def listify(obj):
 
 class Selection(list):
     
-    def __init__(self, df, columns = [-1]):
-        self._ncols = df.shape[1]
+    def __init__(self, df=None, columns = [-1], ncols=0):
+        self._ncols = ncols if df is None else df.shape[1]
         self._set = set([])
         if columns == [-1]:
             self.select_all()
@@ -53,56 +79,457 @@ class Selection(list):
 def sniff_delimiter(str_data):
     return csv.Sniffer().sniff(str_data).delimiter
 
+# Numeric engines
+# Data smaller than this, in bytes, is parsed by the numpy engine 
+# when chosen automatically, larger data by the mmap engine if it is 
+# in a regular file, by the pandas engine otherwise
+NUMPY_SIZE_MAX = 2**23
+
+# Bytes of lines decoded at once by parse_numeric
+BLOCKSIZE = 2**24
+
+NEWLINE = ord('\n')
+
+def _fromstring(str_data, sep=','):
+    with warnings.catch_warnings():
+        # numpy warns when it stops at a field that isn't a number
+        warnings.simplefilter('ignore')
+        if sep.isspace():
+            return numpy.fromstring(str_data, sep=' ')
+        # Whitespace in the separator matches any whitespace, e.g. '\r'
+        return numpy.fromstring(str_data.replace('\n', sep), 
+                                sep=' {} '.format(sep))
+
+def parse_numeric(buf, sep=',', start=0, dtype=float, blocksize=BLOCKSIZE):
+    """return the index, array of the first numbers of the lines of buf, 
+    a string or a memory-mapped file, from the offset start, and the 2d 
+    array of the other numbers, stored in dtype. The index is kept in 
+    float64.
+    
+    The lines are counted on the bytes viewed as an array, so the arrays 
+    are allocated once, then decoded by blocks of about blocksize bytes.
+    Raise ValueError if some lines have a different number of numbers, 
+    or empty fields."""
+    # Trailing blank lines
+    stop = len(buf)
+    while stop > start and buf[stop-1].isspace():
+        stop -= 1
+    if stop <= start:
+        raise ValueError('no data')
+    end = buf.find('\n', start, stop)
+    first = buf[start:stop if end < 0 else end]
+    nfields = len(first.split() if sep.isspace() else first.split(sep))
+    b = numpy.frombuffer(buf, dtype=numpy.uint8)
+    nrows = 1 + sum(numpy.count_nonzero(b[i:min(i+blocksize, stop)] == NEWLINE)
+                    for i in range(start, stop, blocksize))
+    index = numpy.empty(nrows)
+    values = numpy.empty((nrows, nfields-1), dtype=dtype)
+    row = 0
+    while start < stop:
+        # Blocks of whole lines
+        end = stop
+        if start + blocksize < stop:
+            end = buf.rfind('\n', start, start + blocksize)
+            if end < 0:
+                # A line longer than the block
+                end = buf.find('\n', start + blocksize, stop)
+            end = end < 0 and stop or end
+        n = numpy.count_nonzero(b[start:end] == NEWLINE) + 1
+        block = _fromstring(buf[start:end], sep)
+        if block.size != n * nfields or row + n > nrows:
+            raise ValueError('data is not a table of numbers')
+        block = block.reshape(n, nfields)
+        index[row:row+n] = block[:, 0]
+        values[row:row+n] = block[:, 1:]
+        row += n
+        start = end + 1
+    return index, values
+
+def _frame(index, values, usecols=None):
+    """return the dataframe of the columns usecols of the file, whose
+    index and other columns are given, labelled by their position as
+    read_pandas does.
+    
+    With all the columns, the data of the dataframe is values itself."""
+    columns = range(1, values.shape[1]+1)
+    data = values
+    if usecols is not None and usecols[1:] != columns:
+        columns = usecols[1:]
+        data = values[:, [c-1 for c in columns]]
+    return pandas.DataFrame(data, index=index, columns=columns, copy=False)
+
+def read_pandas(fo, sep=',', usecols=None, dtype=float, **kwargs):
+    """parse the data with the pandas C parser, the index in float64"""
+    if numpy.dtype(dtype) != numpy.float64:
+        # usecols is needed to type the columns but the index
+        dtype = dict([(c, dtype) for c in usecols[1:]] + [(usecols[0], float)])
+    return pandas.read_csv(fo, 
+                    dtype=dtype, 
+                    sep=sep, 
+                    header=None, 
+                    index_col=0, 
+                    usecols=usecols, 
+                    **kwargs)
+
+def read_numpy(fo, sep=',', usecols=None, dtype=float):
+    """parse the data, numbers only, from the bytes read at once"""
+    return _frame(*parse_numeric(fo.read(), sep, dtype=dtype), 
+                  usecols=usecols)
+
+def read_mmap(fo, sep=',', usecols=None, dtype=float):
+    """parse the data, numbers only, from the memory-mapped file, 
+    without reading it whole in memory"""
+    mm = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        index, values = parse_numeric(mm, sep, start=fo.tell(), dtype=dtype)
+        return _frame(index, values, usecols)
+    finally:
+        mm.close()
+
+def as_float64(df):
+    """return df, or a float64 copy of its data stored in float32, 
+    for computations accumulating values"""
+    if (df.dtypes == numpy.float64).all():
+        return df
+    return df.astype(numpy.float64)
+
+ENGINES = OrderedDict([('pandas', read_pandas), 
+                       ('numpy', read_numpy), 
+                       ('mmap', read_mmap)])
+
 class FlatFile():
     
     """Data file parser with column selection facility"""
     
-    def __init__(self, filename, data_channels=[-1], **kwargs):
+    # Stages the selected columns go through, see add_stage, and the 
+    # filters of the stages the rows appended to a followed file go through
+    stages = ()
+    _live = ()
+    
+    def __init__(self, filename, data_channels=[-1], data_chunksize=0, 
+                 data_lazy=0, data_follow=0, data_engine='auto', 
+                 data_dtype='float64', **kwargs):
         self.fn = filename
-        self.bn = os.path.basename(filename)
-        self._parse_header()
-        self.df = self._parse_data(**kwargs)
-        self._selection = Selection(df=self.df, columns=data_channels)
+        self.bn = archive.basename(filename)
+        self.follow = data_follow
+        self.engine = data_engine
+        # Storage type of the data, float32 halving its memory
+        self.dtype = numpy.dtype(data_dtype)
+        self.parse_kwargs = kwargs
+        # The file is opened once: the header is read line by line, then
+        # the same buffer, positioned at the first line of data, is handed
+        # to the numeric parser.
+        # The data of a lazy file, or of a file streamed by chunks, 
+        # is only parsed on demand.
+        with self._open() as fo:
+            self._parse_header(fo)
+            self.channels = self._project(data_channels)
+            if not (data_lazy or data_chunksize):
+                self.df = self._parse_data(self._lines(fo), **kwargs)
+        self.select(data_channels)
         if 0 :
             # Remove index name so it doesn't appear on figure
             df.index.name = None
     
-    def _parse_header(self, regex_float=REGEX_FLOAT):
+    def _open(self):
+        """open the file, compressed files and archive members being 
+        decompressed while they are read"""
+        return archive.open_data(self.fn)
+    
+    def __getattr__(self, name):
+        # Only called when the attribute doesn't exist
+        if name == 'df':
+            self.load()
+            return self.df
+        raise AttributeError(name)
+    
+    def is_loaded(self):
+        return 'df' in vars(self)
+    
+    def load(self):
+        """parse the data of a file constructed from its header only"""
+        with self._open() as fo:
+            fo.seek(self.data_offset)
+            df = self._parse_data(self._lines(fo), **self.parse_kwargs)
+        if self.stages:
+            # Only the channels selected when the stages were added 
+            # are parsed
+            vars(self).pop('_raw_ids', None)
+            lif = self._stage_filters()
+            self._live = self.follow and lif or ()
+            self._set_staged(df, lif)
+        else:
+            self.df = df
+        # Empty columns are dropped once the data is loaded
+        self.select(self.data_channels)
+    
+    def add_stage(self, stage):
+        """filter the selected columns through stage, e.g. a chain of 
+        filters, from now on: the data at once if it is loaded, otherwise 
+        when it is loaded or read by chunks, so a streamed file is never 
+        held whole in memory.
+        
+        The filtered columns keep the channels of the original ones, 
+        the stage has a filters method returning new filters, see the 
+        module filters, and a step method returning the number of rows 
+        giving one filtered row.
+        
+        The filters of the stages of a followed file are kept, with the 
+        rows they need, for the rows appended to the file."""
+        channels = self.selected_channels()
+        self.stages = list(self.stages) + [stage]
+        if self.is_loaded():
+            lif = stage.filters()
+            self._live = self.follow and list(self._live) + lif or ()
+            self._set_staged(self.dfs(), lif)
+        self.channels = channels
+        self.select(self.data_channels)
+    
+    def _stage_filters(self):
+        """return new filters of all the stages, in turn"""
+        return [f for stage in self.stages for f in stage.filters()]
+    
+    def _set_staged(self, df, lif):
+        """set the data to the data df filtered by the filters lif, 
+        and the segments of the rows to those of the filtered rows.
+        
+        The filters of a followed file keep the rows they need for the 
+        rows appended to it"""
+        self.df = self._filtered(df, lif)
+        self._set_ids()
+    
+    def _filtered(self, df, lif):
+        """return the data df filtered by the filters lif"""
+        lidf = list(filters.iter_filtered(lif, [df], finish=not self.follow))
+        df = pandas.concat(lidf) if lidf else df.iloc[:0]
+        df = df.astype(self.dtype)
+        df.index.name = None
+        return df
+    
+    def _set_ids(self, ids=None):
+        """set the segments of the filtered rows from those of the rows 
+        parsed, those of the rows appended ids added to them"""
+        if getattr(self, 'segment_ids', None) is None:
+            return
+        # Segments of the rows parsed
+        raw = vars(self).setdefault('_raw_ids', self.segment_ids)
+        if ids is not None:
+            raw = self._raw_ids = numpy.concatenate([raw, ids])
+        step = numpy.prod([stage.step() for stage in self.stages])
+        self.segment_ids = raw[::step][:len(self.df)]
+    
+    def _append(self, df, ids=None):
+        """append the rows df parsed from a followed file, of segments ids, 
+        to the data, filtered by the filters of the stages, return the 
+        number of rows appended"""
+        if self.stages:
+            df = self._filtered(df, self._live)
+        # Keep the columns, e.g. full of Nan values in the new rows only
+        self.df = pandas.concat([self.df, df.reindex(columns=self.df.columns)])
+        if self.stages:
+            self._set_ids(ids)
+        elif ids is not None:
+            self.segment_ids = numpy.concatenate([self.segment_ids, ids])
+        return len(df)
+    
+    def _lines(self, fo):
+        """return the file object or, if the file is followed, a buffer 
+        of its complete lines, the last one being possibly still written, 
+        and keep the offset of their end"""
+        if not self.follow:
+            return fo
+        str_data = fo.read()
+        n = str_data.rfind('\n') + 1
+        self.data_end = fo.tell() - len(str_data) + n
+        return cStringIO.StringIO(str_data[:n])
+    
+    def update(self):
+        """parse the rows appended to a followed file since it was last 
+        parsed and append them to the data, return the number of new rows"""
+        if not self.is_loaded():
+            return 0
+        with self._open() as fo:
+            fo.seek(self.data_end)
+            buf = self._lines(fo)
+        if not buf.getvalue():
+            return 0
+        return self._append(self._parse_data(buf, **self.parse_kwargs))
+    
+    def drop_empty(self, count):
+        """drop the selected columns without values from the data read 
+        by chunks, as they are from the loaded data, count being the series 
+        of the number of values of each one, return their labels"""
+        if count is None or self.channels is not None or self.is_loaded():
+            return []
+        sel = self.selected_channels()
+        empty = [c for c, n in zip(sel, count.values) if not n]
+        if empty:
+            # Only the other channels are parsed from now on
+            self.channels = [c for c in range(self._ncols()) 
+                             if not c in empty]
+            self.select(self.data_channels)
+        return list(count.index[count.values == 0])
+    
+    def release(self):
+        """free the data, it is parsed again on the next access"""
+        if self.is_loaded():
+            del self.df
+            self.select(self.data_channels)
+    
+    def _parse_header(self, fo, regex_float=RE_FLOAT):
+        """reads the header lines and sniffs the delimiter, leaving the file
+        object at the start of the first line of data"""
         self.liheader = []
-        with open(self.fn) as f :
-            for line in f:
-                if re.match(regex_float, line):
-                    # Store the first line of data
-                    self.str_data = line
-                    break
-                self.liheader.append(line)
+        self.data_offset = 0
+        while 1:
+            pos = fo.tell()
+            line = fo.readline()
+            if not line:
+                break
+            if regex_float.match(line):
+                # Store the first line of data and rewind to it
+                self.str_data = line
+                self.data_offset = pos
+                fo.seek(pos)
+                break
+            self.liheader.append(line)
+        self.sep = sniff_delimiter(self.str_data)
+    
+    def metadata(self):
+        """return the typed values of the "key = value" header lines"""
+        return catalog.parse_metadata(self.liheader)
+    
+    def _ncols(self):
+        """number of columns in the file, the index excluded"""
+        return len(self.str_data.strip().split(self.sep))-1
+    
+    def _project(self, data_channels):
+        """return the channels to parse, or None to parse them all"""
+        if data_channels == [-1]:
+            return None
+        n = self._ncols()
+        return sorted(set([c for c in listify(data_channels) if 0<=c<n]))
+    
+    def _usecols(self):
+        """positions in the file of the index and of the channels to parse,
+        None for all of them"""
+        if self.channels is None:
+            return None
+        return [0] + [c+1 for c in self.channels]
+    
+    def _label(self, df):
+        """name the columns after their channel"""
+        df.columns = [c-1 for c in df.columns]
+        df.index.name = None
+        return df
     
-    def _parse_data(self, **kwargs):
-        """reads data from file and remove columns full of Nan values"""
+    def _engine(self, fo):
+        """return the name of the numeric engine parsing the data of fo.
         
-        sep=sniff_delimiter(self.str_data)
-        names = range(len(self.str_data.strip().split(sep))-1)
+        Automatically, the data of tables of numbers, with all the channels 
+        parsed, is parsed by the numpy engine if it is small, by the mmap 
+        one otherwise, and the other data by the pandas one.
+        The mmap engine only reads regular files."""
+        engine = self.engine
+        if engine == 'auto':
+            try:
+                regular = parse_numeric(self.str_data, self.sep)[0].size
+            except ValueError:
+                regular = False
+            small = archive.stat(self.fn).st_size <= NUMPY_SIZE_MAX
+            engine = 'pandas'
+            if regular and self.channels is None:
+                engine = small and 'numpy' or 'mmap'
+        if engine == 'mmap' and not (archive.is_plain(self.fn) and 
+                                     hasattr(fo, 'fileno')):
+            engine = 'numpy'
+        return engine
+    
+    def _read_csv(self, fo, **kwargs):
+        """parse data from the current position of the file object,
+        only converting the channels to parse, and keep the name of the 
+        engine used.
         
-        # Parse data file
-        if int(pandas.__version__.split('.')[1])>10:
-            df = pandas.read_csv(self.fn,skiprows=len(self.liheader)-1,
-                            header=0,index_col=0,dtype=float, names=names)
-        else:
-            df = pandas.read_csv(self.fn, 
-                            dtype=float, 
-                            skiprows=len(self.liheader), 
-                            sep=sep, 
-                            names=names,
-                            header=None, 
-                            index_col=0)
-        
-        # remove empty values
-        df = df.dropna(axis=0,how='all')
-        df = df.dropna(axis=1,how='all')
+        The data read by chunks is parsed by the pandas engine, the columns 
+        named after the first line so the rows, or chunks of rows, shorter 
+        than it are parsed too."""
+        engine = kwargs and 'pandas' or self._engine(fo)
+        usecols = self._usecols()
+        if usecols is None and self.dtype != numpy.float64:
+            usecols = range(self._ncols()+1)
+        names = range(self._ncols()+1)
+        pos = fo.tell()
+        self.engine_used = engine
+        if engine == 'pandas':
+            kwargs['names'] = names
+        try:
+            return ENGINES[engine](fo, self.sep, usecols, self.dtype, **kwargs)
+        except ValueError:
+            if not (engine != 'pandas' and self.engine == 'auto'):
+                raise
+        # e.g. empty fields further in the data
+        fo.seek(pos)
+        self.engine_used = 'pandas'
+        return read_pandas(fo, self.sep, usecols, self.dtype, names=names)
+    
+    def _parse_data(self, fo, **kwargs):
+        """reads data from the file object and remove columns full of Nan
+        values"""
+        df = self._label(self._read_csv(fo))
+        
+        # remove empty values, keeping the channels asked for.
+        # Nothing is dropped, or copied, from tables of numbers
+        isnull = df.isnull()
+        if isnull.all(axis=1).any():
+            df = df.dropna(axis=0,how='all')
+        if self.channels is None and isnull.all(axis=0).any():
+            df = df.dropna(axis=1,how='all')
         
         # return the dataframe
         return df
     
+    def _read_chunks(self, fo, chunksize):
+        """iterate over chunks of rows read from the file object.
+        
+        Unlike _parse_data, the columns full of Nan values are kept
+        so all the chunks have the same columns."""
+        for df in self._read_csv(fo, chunksize=chunksize):
+            yield self._label(df).dropna(axis=0,how='all')
+    
+    def iter_chunks(self, chunksize=100000):
+        """Iterate over chunks of chunksize rows of the selected columns.
+        
+        If the data isn't loaded, the chunks are read from the file
+        and the data is never held whole in memory"""
+        if self.is_loaded():
+            dfs = self.dfs()
+            for i in range(0, len(dfs), chunksize):
+                yield dfs.iloc[i:i+chunksize]
+            return
+        with self._open() as fo:
+            fo.seek(self.data_offset)
+            chunks = (df.icol(self._selection) 
+                      for df in self._read_chunks(fo, chunksize))
+            for df in filters.iter_filtered(self._stage_filters(), chunks):
+                yield df
+    
+    def select(self, data_channels=[-1], **kwargs):
+        """select the columns given by their channel, i.e. their position 
+        in the file if only some channels were parsed, or in the data"""
+        self.data_channels = data_channels
+        columns = data_channels
+        ncols = self._ncols()
+        if self.channels is not None:
+            # Position among the parsed channels
+            ncols = len(self.channels)
+            if not data_channels == [-1]:
+                columns = [i for i, c in enumerate(self.channels) 
+                           if c in listify(data_channels)]
+        if self.is_loaded():
+            self._selection = Selection(df=self.df, columns=columns)
+        else:
+            self._selection = Selection(ncols=ncols, columns=columns)
+    
     def __iter3__(self):
         return self.dfs().iteritems()
     
@@ -113,45 +540,300 @@ class FlatFile():
         
     def __iter__(self):
         """Iterate over the selected columns from the data dataframe """
+        # Loading the data can change the selection
+        df = self.df
         for col in self._selection:
-            yield self.df.icol(col)
+            yield df.icol(col)
+    
+    def selected_channels(self):
+        """return the positions in the data of the selected columns"""
+        sel = list(self._selection)
+        if self.channels is None:
+            return sel
+        return [self.channels[i] for i in sel]
     
 ##    def selection(self):
     def dfs(self):
-        """return the dataframe of selected columns"""
-        return self.df.icol(self._selection)
+        """return the dataframe of selected columns, 
+        a view of the data if they are contiguous"""
+        sel = list(self._selection)
+        if sel and sel == range(sel[0], sel[-1]+1):
+            return self.df.iloc[:, sel[0]:sel[-1]+1]
+        return self.df.icol(sel)
 
 
 class XSegFile(FlatFile):
     
-    def _parse_data(self, data_segment_range = -1, **kwargs):
-        segments = data_segment_range
-        with open( self.fn, 'ru') as fo :
-            liseg = []
-            [fo.readline() for i in range ( len(self.liheader)-2) ]
-            reader = csv.reader(fo, delimiter=",", quoting=csv.QUOTE_NONNUMERIC)
-            while 1 :
-                try :
-                    n = reader.next()
-                except ValueError as er :
-                    liseg.append([])
-                    continue
-                except StopIteration:
-                    break
-                n and liseg[-1].append(n)
+    """Multiple segment data file, each segment starting with a 
+    'Segment N:' line, the first one ending the header.
+    
+    The segments are indexed by the byte offsets of their data, 
+    so only the selected ones are parsed. With data_segment_index, 
+    the header and the segment index are kept in a sidecar file, 
+    next to the data file, for the next times it is opened."""
+    
+    def __init__(self, filename, data_segment_index=0, **kwargs):
+        self.segment_index = data_segment_index
+        FlatFile.__init__(self, filename, **kwargs)
+    
+    def _open(self):
+        fo = FlatFile._open(self)
+        if archive.is_plain(self.fn):
+            return fo
+        # The segments are read by their offset in the decompressed data
+        with fo:
+            return io.BytesIO(fo.read())
+    
+    def _sidecar_fn(self):
+        path, member = archive.split(self.fn)
+        d, bn = os.path.split(path)
+        if member is not None:
+            bn += archive.SEP_MEMBER + member.replace('/', '_')
+        return os.path.join(d, '.' + bn + SUFFIX_SIDECAR)
+    
+    def _fingerprint(self):
+        st = archive.stat(self.fn)
+        return [SIDECAR_FORMAT, st.st_size, st.st_mtime]
+    
+    def _load_sidecar(self):
+        """set the header and the segment index from the sidecar file, 
+        return False if it is missing or out of date"""
+        try:
+            with open(self._sidecar_fn()) as fo:
+                sidecar = json.load(fo)
+        except (IOError, ValueError):
+            return False
+        if sidecar.pop('fingerprint') != self._fingerprint():
+            return False
+        vars(self).update(sidecar)
+        self.segments = [tuple(seg) for seg in self.segments]
+        return True
+    
+    def _write_sidecar(self, fo):
+        # Rows and x column limits of each segment
+        self.segment_stats = []
+        for i in range(len(self.segments)):
+            x = pandas.read_csv(self._segment_buffer(fo, i), dtype=float, 
+                                sep=self.sep, header=None, usecols=[0])[0]
+            self.segment_stats.append((len(x), x.min(), x.max()))
+        sidecar = dict(fingerprint=self._fingerprint())
+        for k in ['liheader', 'str_data', 'sep', 'data_offset', 'segments', 
+                  'segment_stats']:
+            sidecar[k] = getattr(self, k)
+        try:
+            with open(self._sidecar_fn(), 'w') as fo:
+                json.dump(sidecar, fo)
+        except IOError:
+            # e.g. read-only data directory
+            pass
+    
+    def _parse_header(self, fo, *args, **kwargs):
+        if self.segment_index and self._load_sidecar():
+            return
+        FlatFile._parse_header(self, fo, *args, **kwargs)
+        if self.segment_index:
+            self.segments = self._index_segments(fo)
+            self._write_sidecar(fo)
+    
+    def _index_segments(self, fo, start=None):
+        """return the list of (start, stop) byte offsets of the segments
+        from the offset start, the data offset by default, found with 
+        a regular expression on the memory-mapped file, or on the 
+        decompressed data.
         
-        # Select segments
-        if not segments == -1:
-            if len(segments) == 1:
-                segments.append(segments[0])
-            if len(segments) == 2:
-                liseg = liseg[segments[0]:segments[1]+1]
+        The data of a followed file stops at its last complete line."""
+        if start is None:
+            start = self.data_offset
+        fo.seek(0, os.SEEK_END)
+        size = fo.tell()
+        if size <= start:
+            return [(start, start)]
+        if isinstance(fo, io.BytesIO):
+            mm = fo.getvalue()
+        else:
+            mm = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if self.follow:
+                size = max(mm.rfind('\n', start) + 1, start)
+            starts = [start]
+            stops = []
+            for m in RE_SEGMENT.finditer(mm, start, size):
+                stops.append(m.start())
+                # After the newline ending the "Segment N:" line
+                starts.append(min(m.end() + 1, size))
+            stops.append(size)
+        finally:
+            isinstance(mm, mmap.mmap) and mm.close()
+        return zip(starts, stops)
+    
+    def _select_segments(self, data_segment_range=-1):
+        """return the positions of the segments in the range, 
+        "-1" meaning all of them"""
+        segments = listify(data_segment_range)
+        nseg = len(self.segments)
+        if segments == [-1] or not segments:
+            return range(nseg)
+        if len(segments) == 1:
+            segments = segments * 2
+        return range(nseg)[segments[0]:segments[1]+1]
+    
+    def _segment_buffer(self, fo, i):
+        """return the data of segment i in a buffer"""
+        start, stop = self.segments[i]
+        fo.seek(start)
+        return cStringIO.StringIO(fo.read(stop - start))
+    
+    def _read_segment(self, fo, i, **kwargs):
+        """parse segment i, only converting the channels to parse"""
+        return self._read_csv(self._segment_buffer(fo, i), **kwargs)
+    
+    def _parse_data(self, fo, data_segment_range = -1, **kwargs):
+        # Index the segments, once
+        if not 'segments' in vars(self):
+            self.segments = self._index_segments(fo)
         
-        # All the segments are concatenated here...
-        lidf = [pandas.DataFrame(ar).set_index(0) for ar in numpy.array(liseg)]
-        return pandas.concat(lidf)
+        # All the selected segments are concatenated here...
+        lisel = self._select_segments(data_segment_range)
+        lidf = [self._read_segment(fo, i) for i in lisel]
+        # ... and the segment of each row kept aside, in the smallest type
+        dtype = numpy.min_scalar_type(max(lisel or [0]))
+        self.segment_ids = numpy.repeat(numpy.array(lisel, dtype=dtype), 
+                                        [len(df) for df in lidf])
+        if not lidf:
+            return pandas.DataFrame(columns=(self._usecols() or 
+                                             range(self._ncols()+1))[1:])
+        df = pandas.concat(lidf)
+        df.index.name = None
+        return df
+    
+    def _lines(self, fo):
+        # The segments are read by their offset in the file
+        return fo
+    
+    def update(self):
+        """parse the rows appended to a followed file since it was last 
+        parsed, to its last segment or as new segments, and append them 
+        to the data, return the number of new rows.
+        
+        Only the data from the start of the last segment is indexed 
+        and parsed again."""
+        if not (self.is_loaded() and self.follow):
+            return 0
+        last = len(self.segments) - 1
+        drs = self.parse_kwargs.get('data_segment_range', -1)
+        with self._open() as fo:
+            self.segments[last:] = self._index_segments(fo, 
+                                                    self.segments[last][0])
+            lisel = [i for i in self._select_segments(drs) if i >= last]
+            lidf = [self._read_segment(fo, i) for i in lisel]
+        if not lidf:
+            return 0
+        if lisel[0] == last:
+            # The rows of the last segment already parsed
+            ids = vars(self).get('_raw_ids', self.segment_ids)
+            lidf[0] = lidf[0].iloc[numpy.count_nonzero(ids == last):]
+        ids = numpy.repeat(numpy.array(lisel, 
+                                       dtype=numpy.min_scalar_type(max(lisel))), 
+                           [len(df) for df in lidf])
+        df = pandas.concat(lidf)
+        df.index.name = None
+        return self._append(df, ids)
+    
+    def _read_chunks(self, fo, chunksize):
+        """iterate over chunks of rows of the selected segments"""
+        if not 'segments' in vars(self):
+            self.segments = self._index_segments(fo)
+        drs = self.parse_kwargs.get('data_segment_range', -1)
+        for i in self._select_segments(drs):
+            for df in self._read_segment(fo, i, chunksize=chunksize):
+                df.index.name = None
+                yield df
 
 
+def parse_file(DFF, fn, **kwargs):
+    """Return the file object parsed by the class DFF and None,
+    or None and the error message if the file can't be parsed"""
+    try:
+        return DFF(fn, **kwargs), None
+    except Exception as er:
+        return None, '{}: {}'.format(type(er).__name__, er)
+
+def _parse_file_task(task):
+    """parse_file for multiprocessing.Pool.map
+    
+    The parsed file is written as memory-mapped files to a new directory
+    inside transfer_dir, which is returned instead of the file object
+    so the data isn't pickled through the pool pipe."""
+    DFF, fn, kwargs, transfer_dir = task
+    mf, er = parse_file(DFF, fn, **kwargs)
+    if er:
+        return None, er
+    dn = tempfile.mkdtemp(prefix='.tmp', dir=transfer_dir)
+    try:
+        parsecache.save_file(mf, dn)
+    except (IOError, OSError) as er:
+        shutil.rmtree(dn, ignore_errors=True)
+        return None, '{}: {}'.format(type(er).__name__, er)
+    return dn, None
+
+
+def schedule(lisize, jobs, batch=0):
+    """return the batches of the indexes of the tasks of sizes lisize, 
+    the largest tasks first so the last ones, small, even out the load 
+    of the jobs processes.
+    
+    The batches hold batch tasks, by default a quarter of the share of 
+    each process, as in map_parse."""
+    order = sorted(range(len(lisize)), key=lambda i: -lisize[i])
+    batch = batch or max(1, len(order) // (4 * jobs))
+    return [order[i:i+batch] for i in range(0, len(order), batch)]
+
+def segment_starts(segment_ids):
+    """return the positions of the first rows of the segments of the rows, 
+    given by the non decreasing array segment_ids"""
+    return numpy.concatenate([[0], numpy.flatnonzero(numpy.diff(segment_ids)) 
+                              + 1]).astype(int) if len(segment_ids) else \
+            numpy.empty(0, int)
+
+def reduce_segments(name, values, starts):
+    """return the 2d array of the reduction name, i.e. 'sum', 'mean', 
+    'min', 'max', 'std' or 'trapz', of the columns of the 2d array values 
+    over each segment of rows starting at starts, with the ufunc 
+    reduceat methods.
+    
+    The Nan values are skipped as pandas does, but by trapz, which has 
+    a unit spacing as when it is applied to the data columns."""
+    valid = ~numpy.isnan(values)
+    filled = numpy.where(valid, values, 0.)
+    count = numpy.add.reduceat(valid, starts, axis=0)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        if name == 'min':
+            return numpy.fmin.reduceat(values, starts, axis=0)
+        if name == 'max':
+            return numpy.fmax.reduceat(values, starts, axis=0)
+        if name == 'trapz':
+            # Trapezes of the consecutive rows, but across two segments
+            areas = numpy.zeros_like(values)
+            areas[:-1] = (values[1:] + values[:-1]) / 2
+            areas[starts[1:] - 1] = 0.
+            return numpy.add.reduceat(areas, starts, axis=0)
+        total = numpy.add.reduceat(filled, starts, axis=0)
+        if name == 'sum':
+            return numpy.where(count, total, numpy.nan)
+        mean = total / count
+        if name == 'mean':
+            return mean
+        # Population standard deviation, as numpy.std
+        lengths = numpy.diff(numpy.append(starts, len(values)))
+        dev = numpy.where(valid, values - numpy.repeat(mean, lengths, axis=0), 
+                          0.)
+        return numpy.sqrt(numpy.add.reduceat(dev**2, starts, axis=0) / count)
+
+def _apply_task(batch):
+    """apply the functions of the tasks of batch to their series, 
+    for multiprocessing.Pool.imap_unordered"""
+    return [(key, [f(s) for f in lifunc]) for key, lifunc, s in batch]
+
 
 class DataFileParser:
     
@@ -162,36 +844,735 @@ class DataFileParser:
         self.fileformats ['xseg' ] = XSegFile
     
     def parse_files(self, data_files=[], data_format='flat', 
+                    data_jobs=1, 
+                    data_chunksize=0, 
+                    data_lazy=0, 
+                    data_follow=0, 
+                    data_select=[], 
+                    data_catalog=None, 
+                    data_cache_dir=None, 
+                    data_cache_size=512, 
+                    data_cache_bypass=0, 
+                    data_cache_clear=0, 
                     verbose=0, **kwargs):
         DFF = self.fileformats[data_format]
-        limf = [DFF(fn, **kwargs) for fn in data_files]
+        # Archives are replaced by their members
+        data_files = archive.expand(data_files)
+        if data_select:
+            data_files = self.select_files(data_files, data_select, DFF, 
+                                           data_catalog, verbose)
+        if data_lazy or data_chunksize:
+            # Only the headers of the lazy or streamed files are parsed here
+            kwargs['data_lazy'] = data_lazy
+            kwargs['data_chunksize'] = data_chunksize
+            data_cache_bypass = 1
+            data_jobs = 1
+        if data_follow:
+            # The followed files keep the offset of the data parsed
+            kwargs['data_follow'] = data_follow
+            data_cache_bypass = 1
+        cache = parsecache.ParseCache(cache_dir=data_cache_dir, 
+                        size_max=data_cache_size, verbose=verbose)
+        data_cache_clear and cache.clear()
+        options = dict(data_format=data_format, 
+                    data_segment_range=kwargs.get('data_segment_range', -1), 
+                    data_channels=kwargs.get('data_channels', [-1]), 
+                    data_dtype=kwargs.get('data_dtype', 'float64'))
+        
+        # Files from the cache
+        limf = [not data_cache_bypass and cache.get(fn, **options) or None
+                for fn in data_files]
+        [mf.select(**kwargs) for mf in limf if mf]
+        
+        # Parse the other files
+        lifn = [fn for fn, mf in zip(data_files, limf) if not mf]
+        cache = not data_cache_bypass and cache or None
+        liparsed = iter(self.map_parse(DFF, lifn, data_jobs, cache=cache, 
+                                       cache_options=options, **kwargs))
+        for i, fn in enumerate(data_files):
+            if limf[i]:
+                continue
+            mf, er = next(liparsed)
+            if er:
+                print ('error parsing {}: {}'.format(fn, er))
+                continue
+            limf[i] = mf
+        cache and cache.evict()
+        
+        # Drop the files that couldn't be parsed
+        limf = [mf for mf in limf if mf]
         TXT = 'parsed files: {}'
         verbose and print (TXT.format (' '.join([mf.bn for mf in limf])))
-        return [mf for mf in limf if mf]
+        return limf
+    
+    def select_files(self, data_files, data_select, DFF, 
+                     data_catalog=None, verbose=0):
+        """return the files whose header metadata match all the predicates
+        of data_select, e.g. "Scan Rate (V/s) > 0.05", from the catalog 
+        updated with the new or changed files"""
+        hc = catalog.HeaderCatalog(data_catalog, verbose=verbose)
+        try:
+            hc.update(data_files, DFF)
+            lifn = hc.select(data_files, data_select)
+        finally:
+            hc.close()
+        TXT = 'selected {} out of {} files'
+        verbose and print (TXT.format(len(lifn), len(data_files)))
+        return lifn
+    
+    def benchmark_engines(self, data_files=[], data_format='flat', 
+                          data_repeat=3, verbose=0, **kwargs):
+        """return the dataframe of the rows parsed per second by each numeric 
+        engine (rows) in the data of each file (columns), the best time of 
+        data_repeat parses being kept, Nan for the engines failing or 
+        replaced by another one, e.g. mmap on compressed files"""
+        DFF = self.fileformats[data_format]
+        kwargs = dict(kwargs, data_lazy=1, data_engine='auto')
+        results = OrderedDict()
+        for fn in archive.expand(data_files):
+            # Only the header is parsed here
+            mf = DFF(fn, **kwargs)
+            rates = OrderedDict()
+            for engine in ENGINES:
+                mf.engine = engine
+                t = []
+                try:
+                    for i in range(data_repeat):
+                        t0 = time.time()
+                        mf.engine_used = engine
+                        mf.load()
+                        t.append(time.time() - t0)
+                except Exception as er:
+                    verbose and print ('{} engine failed on {}: {}'.format(
+                                        engine, fn, er))
+                    rates[engine] = numpy.nan
+                    continue
+                if mf.engine_used != engine:
+                    verbose and print ('{} engine replaced by {} on {}'.format(
+                                        engine, mf.engine_used, fn))
+                    rates[engine] = numpy.nan
+                    mf.release()
+                    continue
+                rates[engine] = len(mf.df) / max(min(t), 1e-9)
+                mf.release()
+            results[mf.bn] = pandas.Series(rates)
+        return pandas.DataFrame(results)
+    
+    def map_parse(self, DFF, lifn, data_jobs=1, cache=None, 
+                  cache_options={}, **kwargs):
+        """Return the list of parse_file results, in the order of lifn, 
+        and store the parsed files in the cache if given.
+        
+        The files are parsed across a pool of data_jobs processes,
+        or of one process per cpu if data_jobs is 0. The workers hand
+        the parsed data back through memory-mapped files, written
+        to the cache directory or to shared memory, and the dataframes
+        returned are views on them."""
+        data_jobs = data_jobs or multiprocessing.cpu_count()
+        if data_jobs == 1 or len(lifn) < 2:
+            liparsed = [parse_file(DFF, fn, **kwargs) for fn in lifn]
+            if cache:
+                [cache.put(mf, **cache_options) for mf, er in liparsed if mf]
+            return liparsed
+        
+        # Parse in the worker processes
+        transfer_dir = cache and cache.mkdtemp() or \
+                        tempfile.mkdtemp(dir=parsecache.TRANSFER_DIR)
+        tasks = [(DFF, fn, kwargs, transfer_dir) for fn in lifn]
+        try:
+            pool = multiprocessing.Pool(min(data_jobs, len(lifn)))
+            try:
+                chunksize = max(1, len(lifn) // (4 * data_jobs))
+                lires = pool.map(_parse_file_task, tasks, chunksize)
+            finally:
+                pool.close()
+                pool.join()
+            
+            # Wrap the workers output
+            liparsed = []
+            for fn, (dn, er) in zip(lifn, lires):
+                if er:
+                    liparsed.append((None, er))
+                    continue
+                dn = cache and cache.adopt(dn, fn, **cache_options) or dn
+                mf = parsecache.load_file(dn)
+                mf.select(**kwargs)
+                liparsed.append((mf, None))
+        finally:
+            # Also on errors or interruptions; the memory maps outlive 
+            # the removal of their files
+            shutil.rmtree(transfer_dir, ignore_errors=True)
+        return liparsed
+
+class Reduction(object):
+    
+    """Column-wise reduction of data given chunk of rows by chunk of rows.
+    
+    The result is that of the reduction over the whole data, 
+    with Nan values skipped as pandas does."""
+    
+    def __init__(self):
+        self.res = None
+    
+    def update(self, df):
+        s = self.reduce(df)
+        self.res = s if self.res is None else self.combine(self.res, s)
+    
+    def result(self):
+        return self.res
+
+
+class SumReduction(Reduction):
+    
+    """Sums and counts of the values, so the chunks whose column is full 
+    of Nan values, whose pandas sum is Nan, are skipped too"""
+    
+    def reduce(self, df):
+        return pandas.concat([df.fillna(0).sum(), df.count()], axis=1)
+    
+    def combine(self, res, s):
+        return res + s
+    
+    def result(self):
+        return self.res[0].where(self.res[1] > 0)
+
+
+class MinReduction(Reduction):
+    
+    def reduce(self, df):
+        return df.min()
+    
+    def combine(self, res, s):
+        return pandas.concat([res, s], axis=1).min(axis=1)
+
+
+class MaxReduction(Reduction):
+    
+    def reduce(self, df):
+        return df.max()
+    
+    def combine(self, res, s):
+        return pandas.concat([res, s], axis=1).max(axis=1)
+
+
+class MeanReduction(SumReduction):
+    
+    def result(self):
+        return self.res[0] / self.res[1]
+
+
+class StdReduction(Reduction):
+    
+    """Population standard deviation, as numpy.std, from the counts, 
+    means and sums of squared deviations of the chunks"""
+    
+    def reduce(self, df):
+        mean = df.mean()
+        return pandas.concat([df.count(), mean.fillna(0), 
+                              ((df - mean)**2).fillna(0).sum()], axis=1)
+    
+    def combine(self, res, s):
+        n_a, mean_a, m2_a = [res[i].values for i in range(3)]
+        n_b, mean_b, m2_b = [s[i].values for i in range(3)]
+        n = n_a + n_b
+        delta = mean_b - mean_a
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            mean = numpy.where(n, mean_a + delta * n_b / n, 0)
+            m2 = m2_a + m2_b + numpy.where(n, delta**2 * n_a * n_b / n, 0)
+        return pandas.DataFrame({0:n, 1:mean, 2:m2}, index=res.index)
+    
+    def result(self):
+        return numpy.sqrt(self.res[2] / self.res[0])
+
+
+class TrapzReduction(Reduction):
+    
+    """numpy.trapz as applied to the data columns, i.e. with unit spacing, 
+    carried over the chunk boundaries"""
+    
+    def __init__(self):
+        super(TrapzReduction, self).__init__()
+        self.last = None
+    
+    def update(self, df):
+        if not len(df):
+            return
+        s = df.apply(numpy.trapz)
+        if self.last is not None:
+            # Trapeze between the last row of the previous chunk 
+            # and the first row of this one
+            s += 0.5 * (self.last + df.iloc[0])
+        self.last = df.iloc[-1]
+        self.res = s if self.res is None else self.res + s
+
 
 class DataProcessor:
     
     def __init__(self):
         self.processors = {'trapz':numpy.trapz}
+        # Reductions computed chunk by chunk on streamed files
+        self.reductions = {'trapz':TrapzReduction}
+        for name, R in [('trapz', TrapzReduction), 
+                        ('sum', SumReduction), 
+                        ('mean', MeanReduction), 
+                        ('min', MinReduction), 
+                        ('amin', MinReduction), 
+                        ('max', MaxReduction), 
+                        ('amax', MaxReduction), 
+                        ('std', StdReduction)]:
+            self.reductions['numpy.' + name] = R
+        # Functions reducing the columns of a 2d array with axis=0, applied 
+        # at once to the stacked data of the files of the same length
+        self.stacked = set([numpy.trapz, numpy.sum, numpy.mean, numpy.amin, 
+                            numpy.amax, numpy.std])
+        # Size cap in bytes of the stacked arrays
+        self.stack_size = 2**28
+        # Functions reduced over all the segments at once, by their name 
+        # in reduce_segments
+        self.segmented = {numpy.trapz:'trapz', numpy.sum:'sum', 
+                          numpy.mean:'mean', numpy.amin:'min', 
+                          numpy.amax:'max', numpy.std:'std'}
+        # Versions of the processors, part of the keys of their cached 
+        # results, e.g. the distributions of the plugin processors
+        self.versions = {}
+        # Window length of the windowed processors, threshold of the 
+        # crossings
+        self.window = 11
+        self.threshold = 0.
     
-    def compute(self, limf, data_process='', verbose=0, **kwargs):
+    def version(self, data_process):
         if data_process.startswith('numpy'):
-            func = getattr(numpy, data_process.split('.')[1])
+            return 'numpy ' + numpy.__version__
+        if data_process in windowed.PROCESSORS:
+            return 'persistlab {} window={} threshold={}'.format(
+                                __version__, self.window, self.threshold)
+        return self.versions.get(data_process, 
+                                 'persistlab {}'.format(__version__))
+    
+    def _file_key(self, mf, streamed=0):
+        """return the fingerprint of the data of the file object mf"""
+        st = archive.stat(mf.fn)
+        # The columns of streamed data are named by their position
+        streamed = bool(streamed and not mf.is_loaded())
+        return [os.path.abspath(mf.fn), st.st_size, st.st_mtime, 
+                type(mf).__name__, str(mf.dtype), streamed,
+                mf.parse_kwargs.get('data_segment_range', -1), 
+                getattr(mf, 'derived', ''), getattr(mf, 'filtered', '')]
+    
+    def function(self, data_process):
+        """return the function of the processor named data_process"""
+        if data_process.startswith('numpy'):
+            return getattr(numpy, data_process.split('.')[1])
+        if data_process in windowed.PROCESSORS:
+            return windowed.Processor(data_process, self.window, 
+                                      self.threshold)
+        return self.processors[data_process]
+    
+    def reduction(self, data_process):
+        """return the reduction of the processor named data_process, 
+        a class or a factory"""
+        if data_process in windowed.PROCESSORS:
+            return self.function(data_process).reduction
+        return self.reductions[data_process]
+    
+    def streamable(self, linames):
+        """True if the processors linames all have reductions"""
+        return all(p in self.reductions or p in windowed.PROCESSORS 
+                   for p in linames)
+    
+    def compute(self, limf, data_process='', data_chunksize=0, verbose=0, 
+                data_process_cache=None, 
+                data_process_cache_age=30, data_process_cache_size=64,
+                data_process_cache_bypass=0, data_process_cache_clear=0,
+                data_process_jobs=1, data_process_batch=0, data_window=11, 
+                data_threshold=0., data_process_segments=0, **kwargs):
+        """return the table of the results of the processor(s) data_process 
+        (rows) for each file (columns).
+        
+        The processors are all computed in a single pass over the data of 
+        each file; with several of them, the columns are indexed by the 
+        processor then the file.
+        
+        The processors that aren't stacked are applied to the channels 
+        across a pool of data_process_jobs processes, see apply_ufuncs.
+        
+        The results are kept in the cache data_process_cache, by default 
+        in the cache directory, so only the processors without results 
+        for some channels of a file, new or changed, are computed again. 
+        data_process_cache_clear empties the cache first.
+        
+        With data_process_segments, the processors are computed for each 
+        segment of the files, the rows being indexed by the segment then 
+        the channel; these results aren't cached.
+        
+        The files whose data is loaded by the processors, e.g. lazy ones, 
+        are released once computed."""
+        linames = [p for p in listify(data_process) if p]
+        loaded = [mf.is_loaded() for mf in limf]
+        self.window = data_window
+        self.threshold = data_threshold
+        cache = None
+        if not data_process_cache_bypass:
+            cache = resultcache.ResultCache(data_process_cache, 
+                    age_max=data_process_cache_age, 
+                    size_max=data_process_cache_size, verbose=verbose)
+            data_process_cache_clear and cache.clear()
+        options = dict(jobs=data_process_jobs, batch=data_process_batch)
+        if data_process_segments:
+            liufunc = [self.function(p) for p in linames]
+            lires = self.apply_segments(limf=limf, liufunc=liufunc)
+        elif cache is None:
+            lires = self._compute(limf, linames, data_chunksize, **options)
+        else:
+            lires = self._compute_cached(limf, linames, data_chunksize, cache,
+                                         **options)
+            cache.evict()
+            cache.close()
+        for mf, was_loaded in zip(limf, loaded):
+            was_loaded or mf.release()
+        if len(lires) == 1:
+            df_stats = lires[0]
         else:
-            func = self.processors[data_process]
-        df_stats = self.apply_ufunc(limf=limf, ufunc=func)
+            df_stats = pandas.concat(lires, axis=1, keys=linames, 
+                                     names=['process', 'file'])
         
         # Verbose
         if verbose:
-                print ('Calculations with {}:'.format(data_process))
+                print ('Calculations with {}:'.format(', '.join(linames)))
                 print (df_stats)
         
         return df_stats
     
-    def apply_ufunc(self, limf, ufunc):
-        res = pandas.concat([mf.dfs().apply(ufunc) for mf in limf], axis=1)
+    def derive(self, limf, data_derive='', data_window=11, 
+               data_threshold=0., **kwargs):
+        """replace the selected channels of the files by the channels 
+        derived from them by the windowed processor data_derive, a stage 
+        of the files: the loaded data is derived at once, the other data 
+        when it is loaded or, chunk by chunk, streamed, see 
+        FlatFile.add_stage. 
+        
+        The derived channels keep the names and the channels of the 
+        original ones, so they are selected, processed and plotted 
+        as them."""
+        self.window = data_window
+        self.threshold = data_threshold
+        stage = filters.Derivation(self.function(data_derive))
+        for mf in limf:
+            mf.add_stage(stage)
+            mf.derived = self.version(data_derive) + ' ' + data_derive
+    
+    def _compute(self, limf, linames, data_chunksize=0, **options):
+        """return the list of the results of the processors linames, 
+        options being those of apply_ufuncs"""
+        if data_chunksize and self.streamable(linames):
+            # Stream the data, in constant memory
+            liR = [self.reduction(p) for p in linames]
+            return self.apply_reductions(limf=limf, liReduction=liR, 
+                                         chunksize=data_chunksize)
+        liufunc = [self.function(p) for p in linames]
+        return self.apply_ufuncs(limf=limf, liufunc=liufunc, **options)
+    
+    def _compute_cached(self, limf, linames, data_chunksize, cache, 
+                        **options):
+        """_compute with the results found in cache, computing the others 
+        for the files missing some of them"""
+        if not self.streamable(linames):
+            # Some processors need all the data
+            data_chunksize = 0
+        # Keys of the results of each file, by processor then channel.
+        # The channels selected before the data is read, e.g. of lazy 
+        # files, may hold empty columns, their results are stored empty
+        likeys = []
+        lichannels = []
+        for mf in limf:
+            file_key = self._file_key(mf, data_chunksize)
+            channels = mf.selected_channels()
+            lichannels.append(channels)
+            likeys.append([[cache.key(file_key, c, p, self.version(p)) 
+                            for c in channels] for p in linames])
+        found = cache.get([k for keys in likeys for lik in keys for k in lik])
+        missing = [[not all(k in found for k in lik) for lik in keys] 
+                   for keys in likeys]
+        lii = [i for i, mis in enumerate(missing) if any(mis)]
+        lij = [j for j in range(len(linames)) 
+               if any(missing[i][j] for i in lii)]
+        cache.verbose and print ('{} result(s) cached, {} file(s) to '
+                                 'process'.format(len(found), len(lii)))
+        new = {}
+        if lii:
+            limf_new = [limf[i] for i in lii]
+            linames_new = [linames[j] for j in lij]
+            if data_chunksize:
+                # Reduced file by file anyway, their results are kept apart
+                lilires = [self._compute([mf], linames_new, data_chunksize)
+                           for mf in limf_new]
+            else:
+                lires = self._compute(limf_new, linames_new, **options)
+            items = []
+            for jj, j in enumerate(lij):
+                for col, i in enumerate(lii):
+                    if data_chunksize:
+                        s = lilires[col][jj].iloc[:, 0]
+                    else:
+                        # Without the rows of the columns of other files
+                        s = lires[jj].iloc[:, col]
+                        columns = limf[i].dfs().columns
+                        if len(s) != len(columns) and columns.is_unique:
+                            s = s.loc[columns]
+                    new[i, j] = s
+                    # The channels of the results, the empty ones dropped
+                    channels = limf[i].selected_channels()
+                    if len(s) == len(channels):
+                        results = dict(zip(channels, zip(s.index, s.values)))
+                        items += [(k,) + results.get(c, (None, numpy.nan)) 
+                                  for k, c in zip(likeys[i][j], lichannels[i])]
+            cache.put(items)
+        lires = []
+        for j in range(len(linames)):
+            lis = []
+            for i, keys in enumerate(likeys):
+                if (i, j) in new:
+                    lis.append(new[i, j])
+                else:
+                    lifound = [found[k] for k in keys[j] 
+                               if found[k][0] is not None]
+                    labels, values = zip(*lifound) if lifound else ([], [])
+                    lis.append(pandas.Series(values, index=labels))
+            lires.append(self._frame(limf, lis))
+        return lires
+    
+    def _frame(self, limf, lis):
+        """return the results lis of the files limf as a dataframe"""
+        res = pandas.concat(lis, axis=1)
         res.columns = [mf.bn for mf in limf]
         return res
+    
+    def apply_ufunc(self, limf, ufunc):
+        return self.apply_ufuncs(limf, [ufunc])[0]
+    
+    def apply_ufuncs(self, limf, liufunc, jobs=1, batch=0):
+        """return the list of the results of the functions of liufunc 
+        applied to the selected columns of the files, in one pass over 
+        the files.
+        
+        The processors with a reduce_stack method are applied to all the 
+        files at once, see apply_batched. The other functions that aren't 
+        stacked are applied across a pool of jobs processes, or of one 
+        process per cpu if jobs is 0, see map_apply."""
+        listacked = [f for f in liufunc if f in self.stacked]
+        libatched = [f for f in liufunc if hasattr(f, 'reduce_stack')]
+        lifunc = [f for f in liufunc 
+                  if not f in self.stacked and not f in libatched]
+        results = dict(zip(listacked, self.apply_stacked(limf, listacked)))
+        results.update(zip(libatched, self.apply_batched(limf, libatched)))
+        jobs = jobs or multiprocessing.cpu_count()
+        if lifunc and jobs > 1:
+            lilis = self.map_apply(limf, lifunc, jobs, batch)
+        else:
+            lilis = [[] for f in lifunc]
+            for mf in limf:
+                # float32 data is accumulated in float64, one file at a time
+                dfs = as_float64(mf.dfs())
+                [lis.append(dfs.apply(f)) for lis, f in zip(lilis, lifunc)]
+        results.update((f, self._frame(limf, lis)) 
+                       for f, lis in zip(lifunc, lilis))
+        return [results[f] for f in liufunc]
+    
+    def map_apply(self, limf, lifunc, jobs, batch=0):
+        """return the lists of the results of each function of lifunc for 
+        the files, computed across a pool of jobs processes.
+        
+        Each channel of each file is a task, handed to the processes by 
+        batches of batch tasks, the longest channels first, see schedule.
+        The functions must be picklable, e.g. module functions."""
+        tasks = []
+        lidfs = [mf.dfs() for mf in limf]
+        for i, dfs in enumerate(lidfs):
+            for j in range(dfs.shape[1]):
+                s = dfs.iloc[:, j]
+                # float32 data is accumulated in float64
+                s = s.astype(numpy.float64) if s.dtype != numpy.float64 else s
+                tasks.append(((i, j), lifunc, s))
+        batches = [[tasks[k] for k in lik] for lik in 
+                   schedule([len(t[2]) for t in tasks], jobs, batch)]
+        values = {}
+        pool = multiprocessing.Pool(min(jobs, len(batches) or 1))
+        try:
+            for lires in pool.imap_unordered(_apply_task, batches):
+                values.update(lires)
+        finally:
+            pool.close()
+            pool.join()
+        
+        # Same layout as dfs.apply
+        lilis = []
+        for k in range(len(lifunc)):
+            lilis.append([pandas.Series([values[i, j][k] 
+                                         for j in range(dfs.shape[1])], 
+                                        index=dfs.columns) 
+                          for i, dfs in enumerate(lidfs)])
+        return lilis
+    
+    def apply_segments(self, limf, liufunc):
+        """return the list of the results of the functions of liufunc 
+        applied to the selected columns of each segment of the files.
+        
+        The segments are given by the segment_ids of the files, a single 
+        one for the flat files. The functions of self.segmented, and the 
+        processors with a reduce_segments method, like the function 
+        reduce_segments without the name, are reduced over all the 
+        segments at once, the others applied to each segment."""
+        lilis = [[] for f in liufunc]
+        for mf in limf:
+            dfs = as_float64(mf.dfs())
+            ids = getattr(mf, 'segment_ids', None)
+            if ids is None or len(ids) != len(dfs):
+                ids = numpy.zeros(len(dfs), numpy.uint8)
+            starts = segment_starts(ids)
+            index = pandas.MultiIndex.from_product([ids[starts], dfs.columns],
+                                            names=['segment', 'channel'])
+            for lis, f in zip(lilis, liufunc):
+                if not len(dfs):
+                    res = numpy.empty(0)
+                elif f in self.segmented:
+                    res = reduce_segments(self.segmented[f], dfs.values, 
+                                          starts)
+                elif hasattr(f, 'reduce_segments'):
+                    res = f.reduce_segments(dfs.values, starts, 
+                                            index=dfs.index.values)
+                else:
+                    stops = numpy.append(starts[1:], len(dfs))
+                    res = numpy.array([dfs.iloc[a:b].apply(f).values 
+                                       for a, b in zip(starts, stops)])
+                lis.append(pandas.Series(res.ravel(), index=index))
+        return [self._frame(limf, lis) for lis in lilis]
+    
+    def apply_stacked(self, limf, liufunc):
+        """apply each function of liufunc once to the selected columns of 
+        the files of the same length, stacked side by side in a float64 
+        array, return the list of their results.
+        
+        The files with Nan values, which pandas skips, and the empty ones
+        are reduced one by one as apply_ufuncs does."""
+        if not liufunc:
+            return []
+        lidfs = [mf.dfs() for mf in limf]
+        lilires = [[None] * len(limf) for f in liufunc]
+        groups = OrderedDict()
+        for i, dfs in enumerate(lidfs):
+            if not len(dfs) or numpy.isnan(dfs.values).any():
+                dfs = as_float64(dfs)
+                for lires, f in zip(lilires, liufunc):
+                    lires[i] = dfs.apply(f).values
+            else:
+                groups.setdefault(len(dfs), []).append(i)
+        for n, lii in groups.items():
+            for batch in self._batches(lidfs, lii, n):
+                # float32 data is accumulated in float64
+                stack = numpy.column_stack([lidfs[i].values for i in batch]
+                                           ).astype(numpy.float64, copy=False)
+                for lires, f in zip(lilires, liufunc):
+                    self._split(lidfs, batch, lires, f(stack, axis=0))
+        return [self._stacked_frame(limf, lidfs, lires) for lires in lilires]
+    
+    def apply_batched(self, limf, liufunc):
+        """apply each processor of liufunc once to the selected columns of 
+        the files of the same length, with their Nan values, return the 
+        list of their results, Nan for the empty files.
+        
+        The processors have a reduce_stack method taking the 2d array of 
+        the values of the columns stacked side by side and their index, 
+        a single column broadcast against them, and returning the 1d array 
+        of the results of the columns; the files are stacked with the files 
+        of the same index."""
+        if not liufunc:
+            return []
+        lidfs = [as_float64(mf.dfs()) for mf in limf]
+        lilires = [[None] * len(limf) for f in liufunc]
+        groups = OrderedDict()
+        for i, dfs in enumerate(lidfs):
+            if not len(dfs):
+                for lires in lilires:
+                    lires[i] = numpy.repeat(numpy.nan, dfs.shape[1])
+            else:
+                groups.setdefault(len(dfs), []).append(i)
+        for n, lii in groups.items():
+            for batch in (batch for lij in self._same_index(lidfs, lii) 
+                          for batch in self._batches(lidfs, lij, n)):
+                stack = numpy.column_stack([lidfs[i].values for i in batch])
+                index = lidfs[batch[0]].index.values.astype(float)[:, None]
+                for lires, f in zip(lilires, liufunc):
+                    self._split(lidfs, batch, lires, 
+                                f.reduce_stack(stack, index))
+        return [self._stacked_frame(limf, lidfs, lires) for lires in lilires]
+    
+    def _same_index(self, lidfs, lii):
+        """return the lists of the files lii of the same index"""
+        lilij = []
+        for i in lii:
+            index = lidfs[i].index.values
+            for lij in lilij:
+                if numpy.array_equal(lidfs[lij[0]].index.values, index):
+                    lij.append(i)
+                    break
+            else:
+                lilij.append([i])
+        return lilij
+    
+    def _batches(self, lidfs, lii, n):
+        """yield the files lii, of n rows, by batches whose columns stacked 
+        hold under the size cap"""
+        ncols_max = max(1, self.stack_size // (8 * max(n, 1)))
+        start = 0
+        while start < len(lii):
+            stop = start
+            ncols = 0
+            while stop < len(lii) and (stop == start or 
+                    ncols + lidfs[lii[stop]].shape[1] <= ncols_max):
+                ncols += lidfs[lii[stop]].shape[1]
+                stop += 1
+            yield lii[start:stop]
+            start = stop
+    
+    def _split(self, lidfs, batch, lires, res):
+        """store in lires the results res of the stacked files batch"""
+        j = 0
+        for i in batch:
+            w = lidfs[i].shape[1]
+            lires[i] = res[j:j+w]
+            j += w
+    
+    def _stacked_frame(self, limf, lidfs, lires):
+        """return the results lires of the files limf as a dataframe, 
+        the same layout as the concatenation of the results of the files"""
+        columns = lidfs and lidfs[0].columns
+        same = lidfs and all(dfs.columns.equals(columns) for dfs in lidfs)
+        if same:
+            res = pandas.DataFrame(numpy.column_stack(lires), index=columns)
+            res.columns = [mf.bn for mf in limf]
+            return res
+        return self._frame(limf, [pandas.Series(r, index=dfs.columns) 
+                                  for r, dfs in zip(lires, lidfs)])
+    
+    def apply_reduction(self, limf, Reduction, chunksize):
+        return self.apply_reductions(limf, [Reduction], chunksize)[0]
+    
+    def apply_reductions(self, limf, liReduction, chunksize):
+        """return the list of the results of the reductions of liReduction,
+        all updated with each chunk of the files"""
+        lilis = [[] for R in liReduction]
+        for mf in limf:
+            reds = [R() for R in liReduction]
+            count = None
+            for df in mf.iter_chunks(chunksize):
+                df = as_float64(df)
+                count = df.count() if count is None else count + df.count()
+                [red.update(df) for red in reds]
+            # Without the columns full of Nan values, as the loaded data
+            empty = mf.drop_empty(count)
+            [lis.append(red.result().drop(empty)) 
+             for lis, red in zip(lilis, reds)]
+        return [self._frame(limf, lis) for lis in lilis]
 
 # DEBUG
 def debug():
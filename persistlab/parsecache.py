@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+"""
+    persistlab.parsecache
+    ~~~~~~~~~~~~~
+
+    This module implements an on-disk cache of the parsed data files.
+
+    Each entry is a directory holding the index and the data of the parsed
+    dataframe as .npy files, so they can be memory-mapped back, and the
+    pickled file object stripped of its dataframe (header lines, etc.).
+
+    :copyright: 2013 Stephane Henry.
+    :license: BSD, see LICENSE for more details.
+"""
+
+from __future__ import print_function
+
+import os
+import copy
+import shutil
+import hashlib
+import tempfile
+import cPickle as pickle
+
+import numpy
+import pandas
+
+import archive
+
+# Increase when the layout of the entries or the parsed data changes
+CACHE_FORMAT = 1
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'persistlab')
+
+# Environment variable overriding the cache directory, e.g. for the tests
+ENV_CACHE_DIR = 'PERSISTLAB_CACHE_DIR'
+
+# Parse workers hand their parsed files over through memory-mapped files,
+# written to shared memory when available
+TRANSFER_DIR = os.path.isdir('/dev/shm') and '/dev/shm' or None
+
+FN_INDEX = 'index.npy'
+FN_DATA = 'data.npy'
+FN_STATE = 'state.pkl'
+
+def save_frame(df, dn):
+    """Write the index and the values of a dataframe of floats
+    to the directory dn."""
+    numpy.save(os.path.join(dn, FN_INDEX), numpy.asarray(df.index))
+    numpy.save(os.path.join(dn, FN_DATA), df.values)
+
+def load_frame(dn, columns, index_name=None, mmap_mode='c'):
+    """Return a dataframe whose index and values are memory-mapped
+    from the files written by save_frame.
+
+    The default copy-on-write mode leaves the files untouched
+    if the dataframe is modified."""
+    index = numpy.load(os.path.join(dn, FN_INDEX), mmap_mode=mmap_mode)
+    data = numpy.load(os.path.join(dn, FN_DATA), mmap_mode=mmap_mode)
+    index = pandas.Index(index, name=index_name)
+    return pandas.DataFrame(data, index=index, columns=columns, copy=False)
+
+def save_file(mf, dn):
+    """Write the parsed file object mf to the directory dn"""
+    save_frame(mf.df, dn)
+    # The file object is pickled without its data
+    state = copy.copy(mf)
+    del state.df
+    del state._selection
+    columns = list(mf.df.columns)
+    with open(os.path.join(dn, FN_STATE), 'wb') as fo:
+        pickle.dump((state, columns, mf.df.index.name), fo, -1)
+
+def load_file(dn, mmap_mode='c'):
+    """Return the file object written by save_file,
+    without its column selection"""
+    with open(os.path.join(dn, FN_STATE), 'rb') as fo:
+        mf, columns, index_name = pickle.load(fo)
+    mf.df = load_frame(dn, columns, index_name, mmap_mode=mmap_mode)
+    return mf
+
+def cache_path(*names):
+    """return the path of names in the cache directory, that of the 
+    environment variable PERSISTLAB_CACHE_DIR if it is set when called"""
+    return os.path.join(os.environ.get(ENV_CACHE_DIR) or CACHE_DIR, *names)
+
+def dir_size(dn):
+    return sum(os.path.getsize(os.path.join(dn, fn)) for fn in os.listdir(dn))
+
+
+class ParseCache:
+
+    """Cache of the parsed data files,
+    with a size cap and least recently used eviction
+
+    The entries are keyed on the path, size and modification time
+    of the data file and on the parser options."""
+
+    def __init__(self, cache_dir=None, size_max=512, verbose=0):
+        self.dn = cache_dir or cache_path()
+        # Size cap in MB
+        self.size_max = size_max
+        self.verbose = verbose
+
+    def key(self, fn, **options):
+        st = archive.stat(fn)
+        items = [CACHE_FORMAT, os.path.abspath(fn), st.st_size, st.st_mtime]
+        items += sorted(options.items())
+        return hashlib.sha1(repr(items)).hexdigest()
+
+    def entries(self):
+        if not os.path.isdir(self.dn):
+            return []
+        # Temporary directories start with a dot
+        lidn = [os.path.join(self.dn, k) for k in os.listdir(self.dn)
+                if not k.startswith('.')]
+        return [dn for dn in lidn if os.path.isdir(dn)]
+
+    def get(self, fn, **options):
+        """Return the cached file object, or None if there is no entry"""
+        dn = os.path.join(self.dn, self.key(fn, **options))
+        if not os.path.isfile(os.path.join(dn, FN_STATE)):
+            return None
+        try:
+            mf = load_file(dn)
+        except (IOError, ValueError, EOFError, pickle.UnpicklingError):
+            shutil.rmtree(dn, ignore_errors=True)
+            return None
+        # Touch the entry for the eviction order
+        os.utime(dn, None)
+        return mf
+
+    def mkdtemp(self):
+        """Return a new temporary directory inside the cache directory,
+        ignored by the lookups and the eviction"""
+        try:
+            os.makedirs(self.dn)
+        except OSError:
+            # Already existing, possibly created by another process
+            pass
+        return tempfile.mkdtemp(prefix='.tmp', dir=self.dn)
+
+    def put(self, mf, **options):
+        tmp = None
+        try:
+            tmp = self.mkdtemp()
+            save_file(mf, tmp)
+        except (IOError, OSError) as er:
+            # Caching is only an optimisation
+            tmp and shutil.rmtree(tmp, ignore_errors=True)
+            self.verbose and print ('parse cache not written: {}'.format(er))
+            return None
+        dn = self.adopt(tmp, mf.fn, **options)
+        dn or shutil.rmtree(tmp, ignore_errors=True)
+        return dn
+
+    def adopt(self, tmp, fn, **options):
+        """Move the directory tmp, written by save_file, to the cache entry
+        of the file fn and return the entry, or None if it failed,
+        leaving tmp in place"""
+        dn = os.path.join(self.dn, self.key(fn, **options))
+        try:
+            os.path.isdir(dn) and shutil.rmtree(dn)
+            os.rename(tmp, dn)
+        except (IOError, OSError) as er:
+            self.verbose and print ('parse cache not written: {}'.format(er))
+            return None
+        return dn
+
+    def evict(self):
+        """Remove the least recently used entries until the cache size
+        is under its cap"""
+        lidn = sorted(self.entries(), key=os.path.getmtime)
+        lisize = [dir_size(dn) for dn in lidn]
+        total = sum(lisize)
+        for dn, size in zip(lidn, lisize):
+            if total <= self.size_max * 2**20:
+                break
+            shutil.rmtree(dn, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        [shutil.rmtree(dn, ignore_errors=True) for dn in self.entries()]
+        self.verbose and print ('cleared parse cache {}'.format(self.dn))
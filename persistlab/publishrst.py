@@ -125,7 +125,7 @@ class Publisher:
     def __init__(self):
         self.formats = ['rst', 'pdf', 'html']
         self._str_csv_table = """.. csv-table:: {0}
-   :header-rows: 1
+   :header-rows: {1}
    :stub-columns: 1
    :file: {0}"""
         self.str_rst = ''
@@ -164,7 +164,11 @@ class Publisher:
         df_stats.to_csv(of, float_format=output_float_format)
         verbose and print ('written calculations to "{}"'.format(of))
         
-        str_csv_table = self._str_csv_table.format(data_process_fn)
+        # Multiple level columns are written with a row of index names
+        nlevels = df_stats.columns.nlevels
+        header_rows = nlevels > 1 and nlevels + 1 or 1
+        str_csv_table = self._str_csv_table.format(data_process_fn, 
+                                                   header_rows)
         self.str_rst += str_csv_table + os.linesep + os.linesep
         verbose and print ('added csv-table entry to rst string')
 
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+    persistlab.resultcache
+    ~~~~~~~~~~~~~
+
+    This module implements a persistent cache of the data processing
+    results.
+
+    Each value, the result of a processor on one channel of one file, is
+    stored in a SQLite database, keyed on the file fingerprint (path, size,
+    modification time and parse options), the channel, the processor name
+    and its version, e.g. that of the distribution of a plugin processor.
+
+    :copyright: 2013 Stephane Henry.
+    :license: BSD, see LICENSE for more details.
+"""
+
+from __future__ import print_function
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+
+import numpy
+
+import parsecache
+
+# Increase when the results of the processors change
+RESULTS_FORMAT = 1
+
+# Results file in the cache directory, by default
+RESULTS_BN = 'results.sqlite'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    label TEXT,
+    value REAL,
+    atime REAL);
+CREATE INDEX IF NOT EXISTS results_atime ON results (atime);
+"""
+
+# Keys looked up per query
+QUERY_SIZE = 500
+
+
+class ResultCache:
+
+    """SQLite cache of the processing results, with eviction of the entries
+    unused for age_max days and of the least recently used ones over the
+    size cap"""
+
+    def __init__(self, fn=None, age_max=30, size_max=64, verbose=0):
+        self.fn = fn or parsecache.cache_path(RESULTS_BN)
+        self.age_max = age_max
+        # Size cap in MB
+        self.size_max = size_max
+        self.verbose = verbose
+        d = os.path.dirname(self.fn)
+        d and not os.path.isdir(d) and os.makedirs(d)
+        self.db = sqlite3.connect(self.fn)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def key(self, file_key, channel, process, version):
+        items = [RESULTS_FORMAT, file_key, channel, process, version]
+        return hashlib.sha1(repr(items)).hexdigest()
+
+    def get(self, likeys):
+        """return the dictionary of the (label, value) of the keys found"""
+        values = {}
+        now = time.time()
+        with self.db:
+            for i in range(0, len(likeys), QUERY_SIZE):
+                keys = likeys[i:i+QUERY_SIZE]
+                marks = ', '.join('?' * len(keys))
+                rows = self.db.execute('SELECT key, label, value '
+                        'FROM results WHERE key IN ({})'.format(marks), 
+                        keys).fetchall()
+                # Nan values are stored as NULL
+                values.update((k, (json.loads(l), 
+                                   numpy.nan if v is None else v))
+                              for k, l, v in rows)
+                # Touch the entries for the eviction order
+                self.db.execute('UPDATE results SET atime = ? '
+                        'WHERE key IN ({})'.format(marks), [now] + keys)
+        return values
+
+    def put(self, items):
+        """store the (key, label, value) items, label being the name of 
+        the channel, the values that aren't numbers being skipped"""
+        rows = []
+        now = time.time()
+        for k, l, v in items:
+            try:
+                rows.append((k, json.dumps(l), float(v), now))
+            except (TypeError, ValueError):
+                # Not a number, or a label json can't store
+                pass
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO results '
+                                'VALUES (?, ?, ?, ?)', rows)
+
+    def size(self):
+        """size in bytes of the entries"""
+        pragma = lambda p: self.db.execute('PRAGMA ' + p).fetchone()[0]
+        npages = pragma('page_count') - pragma('freelist_count')
+        return npages * pragma('page_size')
+
+    def evict(self):
+        """Remove the entries unused for age_max days, then the least
+        recently used ones until the cache size is under its cap"""
+        with self.db:
+            self.db.execute('DELETE FROM results WHERE atime < ?',
+                            (time.time() - self.age_max * 86400,))
+        size = self.size()
+        if size <= self.size_max * 2**20:
+            return
+        n = self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        # Entries to remove, for an average entry size
+        excess = n - int(n * self.size_max * 2**20 / size)
+        with self.db:
+            self.db.execute('DELETE FROM results WHERE key IN (SELECT key '
+                    'FROM results ORDER BY atime LIMIT ?)', (excess,))
+
+    def clear(self):
+        with self.db:
+            self.db.execute('DELETE FROM results')
+        self.verbose and print ('cleared results cache {}'.format(self.fn))
@@ -1 +1,18 @@
+"""
+    persistlab.testsuite
+    ~~~~~~~~~~~~~
 
+    The tests use caches in a temporary directory, removed at exit, 
+    rather than those of the user.
+"""
+
+import os
+import atexit
+import shutil
+import tempfile
+
+from persistlab import parsecache
+
+CACHE_DIR = tempfile.mkdtemp(prefix='persistlab_tests_')
+os.environ[parsecache.ENV_CACHE_DIR] = CACHE_DIR
+atexit.register(shutil.rmtree, CACHE_DIR, True)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+    persistlab.testsuite.archive
+    ~~~~~~~~~~~~~
+
+    This module tests the compressed and archived data files.
+
+    :copyright: (c) 2013 by Stephane Henry..
+    :license: BSD, see LICENSE for more details.
+"""
+
+import os
+import bz2
+import gzip
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import unittest
+
+import numpy as np
+
+from persistlab import archive
+from persistlab import measfile
+from persistlab import data
+
+class Archive(unittest.TestCase):
+
+    def setUp(self):
+        self.dn = tempfile.mkdtemp()
+        self.lifn = data.LI_FLATFILE_ALL
+        self.libn = [os.path.basename(fn) for fn in self.lifn]
+        self.zip = os.path.join(self.dn, 'bundle.zip')
+        with zipfile.ZipFile(self.zip, 'w') as zf:
+            [zf.write(fn, bn) for fn, bn in zip(self.lifn, self.libn)]
+        self.tar = os.path.join(self.dn, 'bundle.tar.gz')
+        with tarfile.open(self.tar, 'w:gz') as tf:
+            [tf.add(fn, 'runs/' + bn) for fn, bn in zip(self.lifn, self.libn)]
+
+    def tearDown(self):
+        shutil.rmtree(self.dn)
+
+    def compress(self, fn, ext, Compressed):
+        fn_out = os.path.join(self.dn, os.path.basename(fn) + ext)
+        with open(fn) as fi:
+            fo = Compressed(fn_out, 'wb')
+            fo.write(fi.read())
+            fo.close()
+        return fn_out
+
+    def assert_same_data(self, lifn, lifn_ref, DFF=measfile.FlatFile):
+        for fn, fn_ref in zip(lifn, lifn_ref):
+            mf, mf_ref = DFF(fn), DFF(fn_ref)
+            self.assertTrue(mf.df.equals(mf_ref.df))
+            self.assertEqual(mf.liheader, mf_ref.liheader)
+
+    def test_compressed(self):
+        for ext, Compressed in [('.gz', gzip.GzipFile), ('.bz2', bz2.BZ2File)]:
+            lifn = [self.compress(fn, ext, Compressed) for fn in self.lifn]
+            self.assert_same_data(lifn, self.lifn)
+
+    def test_xseg_compressed(self):
+        fn = self.compress(data.LI_FN_XSEG[0], '.gz', gzip.GzipFile)
+        self.assert_same_data([fn], data.LI_FN_XSEG[:1], measfile.XSegFile)
+
+    def test_benchmark_compressed(self):
+        fn = self.compress(self.lifn[0], '.gz', gzip.GzipFile)
+        dfp = measfile.DataFileParser()
+        rates = dfp.benchmark_engines([fn, self.lifn[0]], data_repeat=1)
+        # The mmap engine, replaced by the numpy one, isn't rated
+        self.assertTrue(np.isnan(rates.iloc[:, 0]['mmap']))
+        self.assertTrue(rates.iloc[:, 0][['pandas', 'numpy']].notnull().all())
+        self.assertTrue(rates.iloc[:, 1].notnull().all())
+    
+    def test_members(self):
+        lifn = archive.expand([self.zip, self.tar])
+        self.assertEqual(lifn[0], self.zip + '::' + self.libn[0])
+        self.assertEqual(lifn[-1], self.tar + '::runs/' + self.libn[-1])
+        self.assertEqual([archive.basename(fn) for fn in lifn], self.libn * 2)
+        self.assert_same_data(lifn, self.lifn * 2)
+
+    def test_compressed_members(self):
+        lifn = [self.compress(fn, ext, Compressed) for fn, (ext, Compressed) 
+                in zip(self.lifn, [('.gz', gzip.GzipFile), 
+                                   ('.bz2', bz2.BZ2File)] * 2)]
+        fn_zip = os.path.join(self.dn, 'compressed.zip')
+        with zipfile.ZipFile(fn_zip, 'w') as zf:
+            [zf.write(fn, os.path.basename(fn)) for fn in lifn]
+        fn_tar = os.path.join(self.dn, 'compressed.tar')
+        with tarfile.open(fn_tar, 'w') as tf:
+            [tf.add(fn, os.path.basename(fn)) for fn in lifn]
+        self.assert_same_data(archive.expand([fn_zip, fn_tar]), self.lifn * 2)
+        fn = self.compress(data.LI_FN_XSEG[0], '.gz', gzip.GzipFile)
+        with tarfile.open(fn_tar, 'a') as tf:
+            tf.add(fn, os.path.basename(fn))
+        self.assert_same_data([fn_tar + '::' + os.path.basename(fn)], 
+                              data.LI_FN_XSEG[:1], measfile.XSegFile)
+
+    def test_decompressed_lines(self):
+        fn = self.compress(self.lifn[2], '.gz', gzip.GzipFile)
+        with open(fn, 'rb') as fi, open(self.lifn[2]) as fo_ref:
+            fo = archive.Decompressed(fi, archive.DECOMPRESSORS['.gz']())
+            fo.blocksize = 7
+            lines = fo_ref.readlines()
+            self.assertEqual([fo.readline() for l in lines], lines)
+            self.assertEqual(fo.readline(), '')
+
+    def test_member_seek(self):
+        with archive.open_data(self.zip + '::' + self.libn[1]) as fo:
+            line = fo.readline()
+            fo.seek(0, os.SEEK_END)
+            self.assertEqual(fo.tell(), os.path.getsize(self.lifn[1]))
+            fo.seek(0)
+            self.assertEqual(fo.readline(), line)
+
+    def test_parse_files(self):
+        dfp = measfile.DataFileParser()
+        ref = dfp.parse_files(self.lifn, data_cache_bypass=1)
+        for jobs in [1, 2]:
+            limf = dfp.parse_files([self.zip, self.tar], data_jobs=jobs,
+                                   data_cache_dir=self.dn)
+            self.assertEqual([mf.bn for mf in limf], self.libn * 2)
+            for mf, mf_ref in zip(limf, ref * 2):
+                self.assertTrue(mf.dfs().equals(mf_ref.dfs()))
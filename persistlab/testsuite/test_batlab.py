@@ -13,9 +13,12 @@
 import unittest
 import glob
 import os
+import sys
 import shutil
 
 import configobj
+import numpy as np
+import pandas
 
 from persistlab import batlab
 from persistlab import measfile
@@ -55,6 +58,35 @@ class BatLabPlotter(unittest.TestCase):
         self.assert_len_lifm(3)
         self.assert_nb_lines([1, 4, 1])
     
+    def test_mode_o_lazy(self):
+        self.limf = measfile.DataFileParser().parse_files(
+                        data.LI_FLATFILE_ALL, data_lazy=1)
+        self.m = 'o'
+        self.visualise()
+        self.assert_nb_lines([1, 4, 1])
+        self.assertFalse(any(mf.is_loaded() for mf in self.limf))
+    
+    def test_update(self):
+        fn = 'output_followed.txt'
+        with open(data.LI_FLATFILE_ALL[1]) as fo:
+            lines = fo.readlines()
+        try:
+            with open(fn, 'w') as fo:
+                fo.writelines(lines[:-3])
+            self.limf = measfile.DataFileParser().parse_files([fn], 
+                                                    data_follow=1)
+            self.m = 'a'
+            self.visualise()
+            self.assertEqual(self.plotter.update(self.lifm), 0)
+            with open(fn, 'a') as fo:
+                fo.writelines(lines[-3:])
+            self.assertEqual(self.plotter.update(self.lifm), 2)
+            self.assert_nb_lines([4])
+            x = self.lifm[0].ax.lines[0].get_xdata()
+            self.assertEqual(len(x), len(self.limf[0].df))
+        finally:
+            os.remove(fn)
+    
 
 class BatLabBase(object):
 ##class BatLabBase:
@@ -146,6 +178,102 @@ class BatLab(BatLabBase, unittest.TestCase):
         self.plb.config_setup(['--data-process', some_process])
         self.assertEqual(self.plb.params.data_process, some_process)
     
+    def test_cli_processes(self):
+        processes =  ['trapz', 'numpy.max']
+        self.plb.exec_kwargs(clargs=data.LI_FLATFILE_ALL + 
+                             ['-p'] + processes + ['-u', '-uf', 'rst'])
+        self.assertEqual(self.plb.params.data_process, processes)
+        fn = os.path.join(self.plb.params.output_dir, 'stats.csv')
+        with open(fn) as fo:
+            self.assertEqual(fo.readline().split(',')[0], 'process')
+    
+    def test_cli_derive(self):
+        self.plb.exec_kwargs(clargs=data.LI_FLATFILE_ALL + 
+                             ['--data-derive', 'rolling.mean', 
+                              '--data-window', '3', '-p', 'numpy.nanmax'])
+        mf = self.plb.limf[1]
+        self.assertEqual(mf.derived.split()[-1], 'rolling.mean')
+        self.assertEqual(len(mf.dfs()), len(mf.df))
+    
+    def test_benchmark_failed(self):
+        # All the engines failed
+        rates = pandas.DataFrame(np.nan, index=measfile.ENGINES.keys(), 
+                                 columns=['flatfile_0.txt'])
+        self.plb.dataparser.benchmark_engines = lambda **kwargs: rates
+        self.plb.params.data_engine = 'auto'
+        with open(os.devnull, 'w') as fo:
+            stdout, sys.stdout = sys.stdout, fo
+            try:
+                self.plb.data_benchmark()
+            finally:
+                sys.stdout = stdout
+        self.assertEqual(self.plb.params.data_engine, 'auto')
+    
+    def test_cli_window(self):
+        clargs = ['--data-derive', 'savgol.derivative', '--data-window', '2']
+        with open(os.devnull, 'w') as fo:
+            stderr, sys.stderr = sys.stderr, fo
+            try:
+                self.assertRaises(SystemExit, self.plb.config_setup, clargs)
+            finally:
+                sys.stderr = stderr
+        self.assertRaises(ValueError, self.plb.config_setup, 
+                          data_process='rolling.mean', data_window=0)
+    
+    def test_cli_select_invalid(self):
+        with open(os.devnull, 'w') as fo:
+            stderr, sys.stderr = sys.stderr, fo
+            try:
+                self.assertRaises(SystemExit, self.plb.config_setup, 
+                                  data.LI_FLATFILE_ALL + 
+                                  ['-q', 'Scan Rate'])
+            finally:
+                sys.stderr = stderr
+        self.assertRaises(ValueError, self.plb.config_setup, 
+                          data_select=['Scan Rate > 0.1', 'Scan Rate'])
+    
+    def test_cli_filters_invalid(self):
+        for specs in [['bogus'], ['scale:abc'], ['baseline:2', 'resample:0']]:
+            with open(os.devnull, 'w') as fo:
+                stderr, sys.stderr = sys.stderr, fo
+                try:
+                    self.assertRaises(SystemExit, self.plb.config_setup, 
+                                      data.LI_FLATFILE_ALL + 
+                                      ['--data-filters'] + specs)
+                finally:
+                    sys.stderr = stderr
+            self.assertRaises(ValueError, self.plb.config_setup, 
+                              data_filters=specs)
+    
+    def test_cli_follow_invalid(self):
+        for options in [['-f', '--data-follow', '1', '-dl', '-s'], 
+                        ['-f', '--data-follow', '1']]:
+            with open(os.devnull, 'w') as fo:
+                stderr, sys.stderr = sys.stderr, fo
+                try:
+                    self.assertRaises(SystemExit, self.plb.config_setup, 
+                                      data.LI_FLATFILE_ALL + options)
+                finally:
+                    sys.stderr = stderr
+        self.assertRaises(ValueError, self.plb.config_setup, figure_plot=1, 
+                          data_follow=1, data_lazy=1, figure_show=1)
+        self.assertRaises(ValueError, self.plb.config_setup, figure_plot=1, 
+                          data_follow=1)
+    
+    def test_cli_filters(self):
+        specs = ['scale:2', 'resample:2']
+        self.plb.exec_kwargs(clargs=data.LI_FLATFILE_ALL + 
+                             ['--data-filters'] + specs + 
+                             ['-p', 'numpy.nanmax'])
+        self.assertEqual(self.plb.limf[1].filtered, ' '.join(specs))
+        self.assertEqual(len(self.plb.limf[2].df), 15)
+        # The chain is kept with the settings
+        self.plb.config_write()
+        self.plb.params.data_filters = []
+        self.plb.config_setup(clargs=['--config-load-from', 
+                                      self.plb.sm.config.filename])
+        self.assertEqual(self.plb.params.data_filters, specs)
+    
     def test_cli_load_settings(self):
         """Command line interface _ load settings from file option"""
         self.plb.params.figure_plot=1
@@ -200,6 +328,61 @@ class BatLab(BatLabBase, unittest.TestCase):
                     )
     
 
+class BatLabIncremental(BatLabBase, unittest.TestCase):
+    
+    def setUp(self):
+        super(BatLabIncremental, self).setUp()
+        self.dn = 'output_incremental_data'
+        os.mkdir(self.dn)
+        self.lifn = [shutil.copy(fn, self.dn) or 
+                     os.path.join(self.dn, os.path.basename(fn))
+                     for fn in data.LI_FLATFILE_ALL]
+    
+    def tearDown(self):
+        super(BatLabIncremental, self).tearDown()
+        shutil.rmtree(self.dn, ignore_errors=True)
+    
+    def run_incremental(self, lifn):
+        self.plb = batlab.PersistLab()
+        self.plb.exec_kwargs(data_files=lifn, data_process='numpy.trapz', 
+                             data_cache_bypass=1, output_incremental=1, 
+                             figure_plot=1)
+        return [mf.fn for mf in self.plb.limf]
+    
+    def test_incremental(self):
+        self.assertEqual(self.run_incremental(self.lifn), self.lifn)
+        self.assertEqual(self.plb.params.output_dir, 'output')
+        stats = self.plb.incremental.stats
+        # Nothing changed
+        self.assertEqual(self.run_incremental(self.lifn), [])
+        self.assertTrue(self.plb.incremental.stats.equals(stats))
+        # One file changed
+        st = os.stat(self.lifn[1])
+        os.utime(self.lifn[1], (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(self.run_incremental(self.lifn), self.lifn[1:2])
+        self.assertEqual(sorted(self.plb.incremental.stats.columns), 
+                         sorted(stats.columns))
+        # One file removed
+        self.assertEqual(self.run_incremental(self.lifn[1:]), [])
+        self.assertEqual(len(self.plb.incremental.stats.columns), 
+                         len(stats.columns) - 1)
+        # The figure of all the files is drawn again without it
+        self.assertEqual([mf.fn for fm in self.plb.lifm for mf in fm.limf], 
+                         self.lifn[1:])
+        # The figures of the previous runs are dropped, even if none is drawn
+        self.plb.incremental.figures = ['fig_all']
+        self.assertEqual(self.plb.incremental.merge_figures([]), [])
+    
+    def test_failed(self):
+        fn = os.path.join(self.dn, 'failed.txt')
+        with open(fn, 'w') as fo:
+            fo.write('not data\n')
+        self.assertEqual(self.run_incremental(self.lifn + [fn]), self.lifn)
+        # The file that failed to parse is parsed again, and only it
+        self.assertEqual(self.run_incremental(self.lifn + [fn]), [])
+        self.assertEqual(self.plb.incremental.modified, [fn])
+    
+
 class BatLab_config_setup(BatLabBase, unittest.TestCase):
     
     def setUp(self):
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+    persistlab.testsuite.catalog
+    ~~~~~~~~~~~~~
+
+    This module tests the header metadata catalog.
+
+    :copyright: (c) 2013 by Stephane Henry..
+    :license: BSD, see LICENSE for more details.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from persistlab import catalog
+from persistlab import measfile
+from persistlab import data
+
+class Metadata(unittest.TestCase):
+    
+    def test_parse(self):
+        md = measfile.XSegFile(data.LI_FN_XSEG[0], data_lazy=1).metadata()
+        self.assertEqual(md['Scan Rate (V/s)'], 0.1)
+        self.assertEqual(md['Segment'], 4)
+        self.assertEqual(md['Sensitivity (A/V)'], 1e-6)
+        self.assertEqual(md['Init P/N'], 'N')
+        self.assertEqual(md['Instrument Model'], 'CHI760C')
+    
+    def test_predicate(self):
+        self.assertEqual(catalog.parse_predicate('Scan Rate (V/s) > 0.05'), 
+                         ('Scan Rate (V/s)', '>', 0.05))
+        self.assertRaises(ValueError, catalog.parse_predicate, 'Segment')
+
+
+class HeaderCatalog(unittest.TestCase):
+    
+    def setUp(self):
+        self.dn = tempfile.mkdtemp()
+        self.fn_db = os.path.join(self.dn, 'catalog.sqlite')
+        self.lifn = data.LI_FLATFILE_ALL + data.LI_FN_XSEG
+        self.hc = catalog.HeaderCatalog(self.fn_db)
+        self.hc.update(self.lifn, measfile.FlatFile)
+    
+    def tearDown(self):
+        self.hc.close()
+        shutil.rmtree(self.dn)
+    
+    def select(self, *lipredicates):
+        return self.hc.select(self.lifn, lipredicates)
+    
+    def test_select(self):
+        self.assertEqual(self.select('Scan Rate (V/s) > 0.05'), 
+                         data.LI_FN_XSEG)
+        self.assertEqual(self.select('Scan Rate (V/s) > 0.5'), [])
+        self.assertEqual(self.select('Init P/N = N', 'Segment >= 4'), 
+                         data.LI_FN_XSEG)
+        self.assertEqual(self.select(), self.lifn)
+    
+    def test_parse_files(self):
+        dfp = measfile.DataFileParser()
+        limf = dfp.parse_files(self.lifn, data_format='xseg', 
+                               data_select=['Segment = 4'], 
+                               data_catalog=self.fn_db, data_cache_bypass=1)
+        self.assertEqual([mf.fn for mf in limf], data.LI_FN_XSEG)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""
+    persistlab.testsuite.filters
+    ~~~~~~~~~~~~~
+
+    This module tests the preprocessing filters.
+
+    :copyright: (c) 2013 by Stephane Henry..
+    :license: BSD, see LICENSE for more details.
+"""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from persistlab import filters
+from persistlab import measfile
+from persistlab import data
+
+class Filters(unittest.TestCase):
+
+    def setUp(self):
+        x = np.linspace(0, 10, 201)
+        self.df = pd.DataFrame({'sin':np.sin(x), 'cos':np.cos(x)}, index=x,
+                               columns=['sin', 'cos'])
+        self.specs = ['baseline:20', 'scale:1e3,2', 'smooth:7', 'resample:3']
+
+    def filtered(self, specs, chunksize):
+        chain = filters.FilterChain(specs)
+        chunks = [self.df.iloc[i:i+chunksize]
+                  for i in range(0, len(self.df), chunksize)]
+        return pd.concat(list(chain.iter_filtered(chunks)))
+
+    def test_chunks(self):
+        for k in range(len(self.specs)):
+            specs = self.specs[k:] + self.specs[:k]
+            ref = self.filtered(specs, 2000)
+            for chunksize in [1, 4, 37]:
+                res = self.filtered(specs, chunksize)
+                np.testing.assert_allclose(res.index.values, ref.index.values)
+                np.testing.assert_allclose(res.values, ref.values)
+
+    def test_values(self):
+        df = self.df
+        res = self.filtered(['scale:1e3,2'], 100)
+        np.testing.assert_allclose(res.values, df.values * 1e3 + 2)
+        res = self.filtered(['baseline:20'], 7)
+        np.testing.assert_allclose(res.values, df - df.iloc[:20].mean())
+        res = self.filtered(['smooth:3'], 10)
+        self.assertTrue(np.isnan(res.values[[0, -1]]).all())
+        np.testing.assert_allclose(res.values[1], df.iloc[:3].mean())
+        res = self.filtered(['resample:4'], 10)
+        self.assertEqual(len(res), 51)
+        np.testing.assert_allclose(res.iloc[1], df.iloc[4:8].mean())
+        self.assertAlmostEqual(res.index[-1], 10)
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, filters.FilterChain, ['smoothen:3'])
+    
+    def test_invalid(self):
+        for spec in ['scale', 'scale:abc', 'resample', 'resample:0', 
+                     'baseline:-1', 'smooth:0']:
+            self.assertRaises(ValueError, filters.FilterChain([spec]).filters)
+
+
+class FilterFiles(unittest.TestCase):
+
+    def setUp(self):
+        dfp = measfile.DataFileParser()
+        kwargs = dict(data_channels=[0], data_cache_bypass=1)
+        self.limf = dfp.parse_files(data.LI_FLATFILE_ALL, data_chunksize=7,
+                                    **kwargs)
+        self.limf_loaded = dfp.parse_files(data.LI_FLATFILE_ALL, **kwargs)
+        self.specs = ['baseline:2', 'smooth:3', 'resample:2']
+
+    def test_streamed(self):
+        filters.apply_filters(self.limf, data_filters=self.specs)
+        filters.apply_filters(self.limf_loaded, data_filters=self.specs)
+        self.assertFalse(any(mf.is_loaded() for mf in self.limf))
+        for mf, mf_ref in zip(self.limf, self.limf_loaded):
+            lidf = list(mf.iter_chunks(7))
+            self.assertFalse(mf.is_loaded())
+            np.testing.assert_allclose(pd.concat(lidf).values, 
+                                       mf_ref.dfs().values)
+            np.testing.assert_allclose(mf.dfs().values, mf_ref.dfs().values)
+            np.testing.assert_allclose(mf.df.index.values, 
+                                       mf_ref.df.index.values)
+            self.assertEqual(mf.selected_channels(),
+                             mf_ref.selected_channels())
+            self.assertEqual(mf.filtered, ' '.join(self.specs))
+        self.assertEqual(len(self.limf[2].dfs()), 15)
+
+    def test_segments(self):
+        mf = measfile.XSegFile(data.LI_FN_XSEG[0])
+        ids = mf.segment_ids
+        filters.apply_filters([mf], data_filters=['resample:4'])
+        self.assertEqual(len(mf.segment_ids), len(mf.df))
+        self.assertEqual(list(np.unique(mf.segment_ids)),
+                         list(np.unique(ids)))
+
+
+class FollowedFiles(unittest.TestCase):
+    
+    def setUp(self):
+        fd, self.fn = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+    
+    def tearDown(self):
+        os.remove(self.fn)
+    
+    def follow(self, DFF, fn, specs, nlines):
+        """return the file fn followed while it is written, its first 
+        nlines lines then the others, and the file fn, both filtered"""
+        with open(fn) as fo:
+            lines = fo.readlines()
+        with open(self.fn, 'w') as fo:
+            fo.writelines(lines[:nlines])
+        mf = DFF(self.fn, data_follow=1)
+        filters.apply_filters([mf], data_filters=specs)
+        n = len(mf.df)
+        with open(self.fn, 'a') as fo:
+            fo.writelines(lines[nlines:])
+        self.assertEqual(mf.update(), len(mf.df) - n)
+        self.assertTrue(len(mf.df) > n)
+        ref = DFF(fn)
+        filters.apply_filters([ref], data_filters=specs)
+        # The rows kept by the filters for the next rows are missing
+        self.assertTrue(len(ref.df) - 3 < len(mf.df) <= len(ref.df))
+        np.testing.assert_allclose(mf.df.values, ref.df.values[:len(mf.df)])
+        np.testing.assert_allclose(mf.df.index.values, 
+                                   ref.df.index.values[:len(mf.df)])
+        return mf, ref
+    
+    def test_update(self):
+        self.follow(measfile.FlatFile, data.FLATFILE_2, 
+                    ['baseline:2', 'smooth:3', 'resample:2'], -9)
+    
+    def test_segments(self):
+        mf, ref = self.follow(measfile.XSegFile, data.LI_FN_XSEG[0], 
+                              ['scale:2', 'resample:4'], 200)
+        self.assertEqual(len(mf.segment_ids), len(mf.df))
+        np.testing.assert_array_equal(mf.segment_ids, 
+                                      ref.segment_ids[:len(mf.df)])
+
+
+if __name__ == '__main__':
+    unittest.main()
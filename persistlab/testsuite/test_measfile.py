@@ -9,7 +9,10 @@
     :license: BSD, see LICENSE for more details.
 """
 
+import os
 import sys
+import shutil
+import tempfile
 import unittest
 
 import pandas
@@ -17,6 +20,7 @@ import pandas as pd
 import numpy as np
 
 from persistlab import measfile
+from persistlab import parsecache
 from persistlab import data
 
 def dataframe():
@@ -70,6 +74,31 @@ class FlatFile(unittest.TestCase):
         # Check shape of the  data
         self.assertEqual(self.mf.df.shape, (3, 4))
     
+    def test_parse_header(self):
+        self.assertEqual(len(self.mf.liheader), 4)
+        self.assertEqual(self.mf.sep, ',')
+        self.assertTrue(self.mf.str_data.startswith('1.000e-1'))
+    
+
+class Projection(unittest.TestCase):
+    
+    def test_flat(self):
+        mf = measfile.FlatFile(data.FLATFILE_1, data_channels=[3, 1, 7])
+        self.assertEqual(list(mf.df.columns), [1, 3])
+        self.assertEqual(list(mf.dfs().columns), [1, 3])
+        self.assertEqual(list(mf.df[3]), [27, 23, 22])
+    
+    def test_streamed(self):
+        mf = measfile.FlatFile(data.FLATFILE_1, data_channels=[2], 
+                               data_chunksize=2)
+        lidf = list(mf.iter_chunks(2))
+        self.assertEqual([list(df.columns) for df in lidf], [[2], [2]])
+    
+    def test_xseg(self):
+        mf = measfile.XSegFile(data.LI_FN_XSEG[0], data_channels=[1])
+        self.assertEqual(mf.df.shape, (320, 1))
+        self.assertEqual(list(mf.dfs().columns), [2])
+
 
 class XSeg(unittest.TestCase):
     
@@ -91,6 +120,96 @@ class XSeg(unittest.TestCase):
     def test_threeseg(self):
         mf = measfile.XSegFile(data.LI_FN_XSEG[0],  data_segment_range=[1, 3])
         self.assertEqual(mf.df.shape, (240, 3))
+    
+    def test_segment_index(self):
+        mf = measfile.XSegFile(data.LI_FN_XSEG[0],  data_segment_range=[-1])
+        self.assertEqual(len(mf.segments), 4)
+        self.assertEqual(mf.df.shape, (320, 3))
+    
+    def test_chunks(self):
+        mf = measfile.XSegFile(data.LI_FN_XSEG[0],  data_segment_range=[2, 3], 
+                               data_chunksize=50)
+        self.assertEqual([len(df) for df in mf.iter_chunks(50)], 
+                         [50, 30, 50, 30])
+    
+    def test_segment_ids(self):
+        mf = measfile.XSegFile(data.LI_FN_XSEG[0],  data_segment_range=[1, 3])
+        self.assertEqual(mf.segment_ids.dtype, np.uint8)
+        self.assertEqual(list(np.bincount(mf.segment_ids)), [0, 80, 80, 80])
+
+
+class SegmentProcessor(unittest.TestCase):
+    
+    def setUp(self):
+        self.mf = measfile.XSegFile(data.LI_FN_XSEG[0])
+        self.dp = measfile.DataProcessor()
+        self.linames = ['trapz', 'numpy.sum', 'numpy.mean', 'numpy.min', 
+                        'numpy.max', 'numpy.std', 'numpy.median']
+    
+    def test_segments(self):
+        stats = self.dp.compute([self.mf], data_process=self.linames, 
+                                data_process_segments=1)
+        self.assertEqual(stats.index.names, ['segment', 'channel'])
+        dfs = self.mf.dfs()
+        for i in range(4):
+            df = dfs[self.mf.segment_ids == i]
+            for p in self.linames:
+                ref = df.apply(self.dp.function(p))
+                np.testing.assert_allclose(stats[p].loc[i].values[:, 0], 
+                                           ref.values)
+    
+    def test_nan(self):
+        self.mf.df.iloc[3:90, 1] = np.nan
+        stats = self.dp.compute([self.mf], data_process=self.linames[:-1], 
+                                data_process_segments=1)
+        df = self.mf.dfs()[self.mf.segment_ids == 1]
+        for p in self.linames[:-1]:
+            ref = df.apply(self.dp.function(p))
+            np.testing.assert_allclose(stats[p].loc[1].values[:, 0], 
+                                       ref.values)
+    
+    def test_flat(self):
+        limf = [measfile.FlatFile(fn) for fn in data.LI_FLATFILE_ALL]
+        stats = self.dp.compute(limf, data_process='numpy.sum', 
+                                data_process_segments=1)
+        ref = self.dp.compute(limf, data_process='numpy.sum', 
+                              data_process_cache_bypass=1)
+        self.assertTrue(stats.loc[0].equals(ref))
+
+
+class XSegSidecar(unittest.TestCase):
+    
+    def setUp(self):
+        self.dn = tempfile.mkdtemp()
+        self.fn = os.path.join(self.dn, 'multiseg.txt')
+        shutil.copy(data.LI_FN_XSEG[0], self.fn)
+    
+    def tearDown(self):
+        shutil.rmtree(self.dn)
+    
+    def xsegfile(self):
+        return measfile.XSegFile(self.fn, data_segment_index=1, 
+                                 data_segment_range=[1, 2])
+    
+    def test_write(self):
+        mf = self.xsegfile()
+        self.assertTrue(os.path.isfile(mf._sidecar_fn()))
+        self.assertEqual([st[0] for st in mf.segment_stats], [80] * 4)
+        self.assertEqual(mf.segment_stats[0][1:], (-0.595, 0.195))
+    
+    def test_load(self):
+        mf = self.xsegfile()
+        mf_sidecar = self.xsegfile()
+        self.assertTrue(mf_sidecar._load_sidecar())
+        self.assertEqual(mf_sidecar.liheader, mf.liheader)
+        self.assertTrue(mf_sidecar.df.equals(mf.df))
+    
+    def test_out_of_date(self):
+        mf = self.xsegfile()
+        with open(self.fn, 'a') as fo:
+            fo.write('0.205, 1e-9, 1e-9, 1e-9' + os.linesep)
+        self.assertFalse(mf._load_sidecar())
+        self.assertEqual(self.xsegfile().segment_stats[-1][0], 81)
 
 
 class DataFileParser(unittest.TestCase):
@@ -105,6 +224,102 @@ class DataFileParser(unittest.TestCase):
     def test_parse_files(self):
         self.assertEqual(len(self.limf),3)
 
+class ParallelParser(unittest.TestCase):
+    
+    def setUp(self):
+        # A file with no line of data
+        fd, self.fn_bad = tempfile.mkstemp(suffix='.txt')
+        os.write(fd, 'header only' + os.linesep)
+        os.close(fd)
+        self.lifn = data.LI_FLATFILE_ALL[:2] + [self.fn_bad] + \
+                        data.LI_FLATFILE_ALL[2:]
+    
+    def tearDown(self):
+        os.remove(self.fn_bad)
+    
+    def test_jobs(self):
+        dfp = measfile.DataFileParser()
+        limf = dfp.parse_files(self.lifn, data_jobs=2, data_cache_bypass=1)
+        self.assertEqual([mf.fn for mf in limf], data.LI_FLATFILE_ALL)
+        limf_serial = dfp.parse_files(self.lifn, data_cache_bypass=1)
+        for mf, mfs in zip(limf, limf_serial):
+            self.assertTrue(mf.df.equals(mfs.df))
+            # The data is a view on the files written by the workers
+            self.assertFalse(mf.df.values.flags.owndata)
+    
+    def test_jobs_cache(self):
+        dn = tempfile.mkdtemp()
+        try:
+            dfp = measfile.DataFileParser()
+            limf = dfp.parse_files(self.lifn, data_jobs=2, data_cache_dir=dn)
+            self.assertEqual(len(os.listdir(dn)), 3)
+            limf_cached = dfp.parse_files(self.lifn, data_cache_dir=dn)
+            for mf, mfc in zip(limf, limf_cached):
+                self.assertTrue(mf.df.equals(mfc.df))
+        finally:
+            shutil.rmtree(dn)
+    
+    def test_jobs_cleanup(self):
+        dn = tempfile.mkdtemp()
+        load_file = parsecache.load_file
+        transfer_dir = parsecache.TRANSFER_DIR
+        def fail(dn):
+            raise IOError('load failed')
+        try:
+            parsecache.load_file = fail
+            parsecache.TRANSFER_DIR = dn
+            dfp = measfile.DataFileParser()
+            self.assertRaises(IOError, dfp.parse_files, self.lifn, 
+                              data_jobs=2, data_cache_bypass=1)
+            # The workers output is removed anyway
+            self.assertEqual(os.listdir(dn), [])
+        finally:
+            parsecache.load_file = load_file
+            parsecache.TRANSFER_DIR = transfer_dir
+            shutil.rmtree(dn)
+
+class ParseCache(unittest.TestCase):
+    
+    def setUp(self):
+        self.dn = tempfile.mkdtemp()
+        self.dfp = measfile.DataFileParser()
+    
+    def tearDown(self):
+        shutil.rmtree(self.dn)
+    
+    def parse(self, **kwargs):
+        return self.dfp.parse_files(data.LI_FLATFILE_ALL, 
+                                    data_cache_dir=self.dn, **kwargs)
+    
+    def test_hit(self):
+        limf = self.parse(data_channels=[0])
+        limf_cached = self.parse(data_channels=[0])
+        self.assertEqual(len(os.listdir(self.dn)), 3)
+        for mf, mfc in zip(limf, limf_cached):
+            self.assertTrue(mfc.df.equals(mf.df))
+            self.assertEqual(mfc.liheader, mf.liheader)
+            self.assertEqual(len(mfc.dfs().columns), 1)
+    
+    def test_key_options(self):
+        self.parse()
+        self.parse(data_segment_range=[1, 2])
+        self.parse(data_channels=[1])
+        self.assertEqual(len(os.listdir(self.dn)), 9)
+    
+    def test_bypass(self):
+        self.parse(data_cache_bypass=1)
+        self.assertEqual(os.listdir(self.dn), [])
+    
+    def test_evict(self):
+        self.parse(data_cache_size=0)
+        self.assertEqual(os.listdir(self.dn), [])
+    
+    def test_clear(self):
+        self.parse()
+        self.parse(data_cache_clear=1, data_cache_bypass=1)
+        self.assertEqual(os.listdir(self.dn), [])
+
+
 class DataProcessor(DataFileParser):
     
     def test_process(self):
@@ -113,4 +328,485 @@ class DataProcessor(DataFileParser):
         self.assertIsInstance(stats,pandas.DataFrame)
 
 
+class LazyFile(unittest.TestCase):
+    
+    def setUp(self):
+        self.mf = measfile.FlatFile(data.FLATFILE_2, data_lazy=1)
+    
+    def test_header_only(self):
+        self.assertFalse(self.mf.is_loaded())
+        self.assertEqual(len(self.mf.liheader), 2)
+    
+    def test_load_release(self):
+        mf = measfile.FlatFile(data.FLATFILE_2)
+        self.assertEqual([s.name for s in self.mf], [0])
+        self.assertTrue(self.mf.dfs().equals(mf.dfs()))
+        self.mf.release()
+        self.assertFalse(self.mf.is_loaded())
+        self.assertTrue(self.mf.df.equals(mf.df))
+    
+    def test_no_channel(self):
+        # None of the channels asked for is in the file
+        for kwargs in [dict(data_lazy=1), dict(data_chunksize=7), {}]:
+            mf = measfile.FlatFile(data.FLATFILE_2, data_channels=[99], 
+                                   **kwargs)
+            self.assertEqual(mf.selected_channels(), [])
+    
+    def test_compute_release(self):
+        # The files loaded by the processors are released
+        dp = measfile.DataProcessor()
+        limf = [self.mf, measfile.FlatFile(data.FLATFILE_2)]
+        for kwargs in [dict(data_process_segments=1), {}]:
+            res = dp.compute(limf, data_process=['numpy.max'], 
+                             data_process_cache_bypass=1, **kwargs)
+            self.assertEqual([mf.is_loaded() for mf in limf], [False, True])
+            np.testing.assert_array_equal(res.values[:, 0], res.values[:, 1])
+
+
+class StreamedFile(unittest.TestCase):
+    
+    def setUp(self):
+        dfp = measfile.DataFileParser()
+        self.limf = dfp.parse_files(data.LI_FLATFILE_ALL, data_chunksize=7)
+        self.limf_loaded = dfp.parse_files(data.LI_FLATFILE_ALL)
+        self.dp = measfile.DataProcessor()
+    
+    def test_header_only(self):
+        self.assertFalse(any(mf.is_loaded() for mf in self.limf))
+    
+    def test_chunks(self):
+        lidf = list(self.limf[2].iter_chunks(7))
+        self.assertEqual([len(df) for df in lidf], [7, 7, 7, 7, 2])
+    
+    def test_load_on_demand(self):
+        for mf, mfl in zip(self.limf, self.limf_loaded):
+            self.assertTrue(mf.dfs().equals(mfl.dfs()))
+            self.assertTrue(mf.is_loaded())
+    
+    def test_reductions(self):
+        for p in ['trapz', 'numpy.sum', 'numpy.mean', 'numpy.min', 
+                  'numpy.max', 'numpy.std']:
+            res = self.dp.compute(self.limf, data_process=p, 
+                                  data_chunksize=7, 
+                                  data_process_cache_bypass=1)
+            ref = self.dp.compute(self.limf_loaded, data_process=p, 
+                                  data_process_cache_bypass=1)
+            np.testing.assert_allclose(res.values, ref.values)
+            self.assertFalse(any(mf.is_loaded() for mf in self.limf))
+    
+    def test_nan_chunk(self):
+        mf = self.limf_loaded[2]
+        # Nan values over the whole second chunk
+        mf.df.iloc[7:14, 0] = np.nan
+        for p in ['numpy.sum', 'numpy.mean', 'numpy.std']:
+            res = self.dp.apply_reduction([mf], self.dp.reduction(p), 7)
+            ref = mf.dfs().apply(self.dp.function(p))
+            np.testing.assert_allclose(res.values[:, 0], ref.values)
+    
+    def test_empty_columns(self):
+        # The columns of flatfile_2 full of Nan values are dropped
+        kwargs = dict(data_process=['numpy.max', 'rolling.mean'], 
+                      data_process_cache_bypass=1)
+        mf = measfile.FlatFile(data.FLATFILE_2, data_chunksize=7)
+        res = self.dp.compute([mf], data_chunksize=7, **kwargs)
+        ref = self.dp.compute([measfile.FlatFile(data.FLATFILE_2)], **kwargs)
+        self.assertEqual(list(res.index), list(ref.index))
+        np.testing.assert_allclose(res.values, ref.values)
+        self.assertEqual(mf.selected_channels(), [0])
+        self.assertFalse(mf.is_loaded())
+    
+    def test_short_rows(self):
+        # The last row of flatfile_2 is shorter than the first ones
+        ref = measfile.FlatFile(data.FLATFILE_2)
+        for chunksize in [2, 3, 5, 10, 15, 30]:
+            mf = measfile.FlatFile(data.FLATFILE_2, data_chunksize=chunksize)
+            df = pd.concat(list(mf.iter_chunks(chunksize)))
+            np.testing.assert_array_equal(df.index, ref.df.index)
+            np.testing.assert_array_equal(df[0].values, ref.df[0].values)
+
+
+class FollowedFile(unittest.TestCase):
+    
+    def setUp(self):
+        with open(data.FLATFILE_2) as fo:
+            self.lines = fo.readlines()
+        fd, self.fn = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+        # The last line is still being written
+        self.write(self.lines[:-3] + [self.lines[-3][:3]])
+        self.mf = measfile.FlatFile(self.fn, data_follow=1)
+        self.ref = measfile.FlatFile(data.FLATFILE_2)
+    
+    def tearDown(self):
+        os.remove(self.fn)
+    
+    def write(self, lines, mode='w'):
+        with open(self.fn, mode) as fo:
+            fo.writelines(lines)
+    
+    def test_update(self):
+        n = len(self.mf.df)
+        # The partial line isn't parsed
+        self.assertEqual(self.mf.df.index[-1], 
+                         float(self.lines[-4].split(',')[0]))
+        self.assertTrue(self.mf.df.equals(self.ref.df.iloc[:n]))
+        self.assertEqual(self.mf.update(), 0)
+        self.write([self.lines[-3][3:]] + self.lines[-2:], 'a')
+        self.assertEqual(self.mf.update(), len(self.ref.df) - n)
+        self.assertTrue(self.mf.df.equals(self.ref.df))
+
+
+class FollowedXSegFile(FollowedFile):
+    
+    def setUp(self):
+        fn = sorted(data.LI_FN_XSEG)[0]
+        with open(fn) as fo:
+            self.lines = fo.readlines()
+        fd, self.fn = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+        # Cut in the second segment, in the middle of a line
+        i = [j for j, l in enumerate(self.lines) 
+             if l.startswith("Segment")][-3] + 5
+        self.write(self.lines[:i] + [self.lines[i][:3]])
+        self.rest = [self.lines[i][3:]] + self.lines[i+1:]
+        self.mf = measfile.XSegFile(self.fn, data_follow=1)
+        self.ref = measfile.XSegFile(fn)
+    
+    def test_update(self):
+        n = len(self.mf.df)
+        self.assertTrue(self.mf.df.equals(self.ref.df.iloc[:n]))
+        self.assertEqual(self.mf.update(), 0)
+        self.write(self.rest, 'a')
+        reads = []
+        read_segment = self.mf._read_segment
+        def spy(fo, i, **kwargs):
+            reads.append(i)
+            return read_segment(fo, i, **kwargs)
+        self.mf._read_segment = spy
+        self.assertEqual(self.mf.update(), len(self.ref.df) - n)
+        self.assertTrue(self.mf.df.equals(self.ref.df))
+        np.testing.assert_array_equal(self.mf.segment_ids, 
+                                      self.ref.segment_ids)
+        # Only the segments from the last one parsed are read again
+        self.assertEqual(reads, range(1, len(self.ref.segments)))
+
+
+class NumericEngine(unittest.TestCase):
+    
+    def test_engines(self):
+        for fn in data.LI_FLATFILE_ALL + data.LI_FN_XSEG:
+            DFF = fn in data.LI_FN_XSEG and measfile.XSegFile or \
+                    measfile.FlatFile
+            ref = DFF(fn, data_engine='pandas')
+            for engine in ['auto', 'numpy', 'mmap']:
+                try:
+                    mf = DFF(fn, data_engine=engine)
+                except ValueError:
+                    # e.g. empty fields in flatfile_2
+                    self.assertNotEqual(engine, 'auto')
+                    self.assertIs(DFF, measfile.FlatFile)
+                    continue
+                # The pandas parser may round the last digit differently
+                np.testing.assert_allclose(mf.df.values, ref.df.values)
+                np.testing.assert_array_equal(mf.df.index, ref.df.index)
+                self.assertEqual(list(mf.df.columns), list(ref.df.columns))
+    
+    def test_parse_numeric(self):
+        index, values = measfile.parse_numeric('1, 2,3\r\n4,5 ,6\n\n')
+        np.testing.assert_array_equal(index, [1, 4])
+        np.testing.assert_array_equal(values, [[2, 3], [5, 6]])
+        self.assertRaises(ValueError, measfile.parse_numeric, '1,2\n3,4,5')
+        self.assertRaises(ValueError, measfile.parse_numeric, '1,,2')
+    
+    def test_benchmark(self):
+        dfp = measfile.DataFileParser()
+        rates = dfp.benchmark_engines(data.LI_FLATFILE_ALL, data_repeat=1)
+        self.assertEqual(list(rates.index), measfile.ENGINES.keys())
+        self.assertEqual(rates.shape, (3, 3))
+        self.assertTrue(rates.loc['pandas'].notnull().all())
+    
+    def test_parse_blocks(self):
+        str_data = 'x\n' + '\n'.join('{0},{0}.5,-{0}'.format(i) 
+                                     for i in range(100)) + '\n\n'
+        index, ref = measfile.parse_numeric(str_data, start=2)
+        self.assertEqual(ref.shape, (100, 2))
+        np.testing.assert_array_equal(index, range(100))
+        for blocksize in [1, 7, 64]:
+            index, values = measfile.parse_numeric(str_data, start=2, 
+                                                   blocksize=blocksize)
+            np.testing.assert_array_equal(values, ref)
+    
+    def test_mmap_view(self):
+        fd, fn = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as fo:
+            fo.write('header\n1 2 3\n4 5 6\n')
+        try:
+            mf = measfile.FlatFile(fn, data_engine='mmap')
+        finally:
+            os.remove(fn)
+        np.testing.assert_array_equal(mf.df.values, [[2, 3], [5, 6]])
+        self.assertFalse(mf.df.values.flags.owndata)
+        self.assertTrue(np.may_share_memory(mf.df.values, mf.dfs().values))
+
 
+class Float32(unittest.TestCase):
+    
+    def setUp(self):
+        self.lifn = data.LI_FLATFILE_ALL + data.LI_FN_XSEG[:1]
+        self.dfp = measfile.DataFileParser()
+        # XSegFile reads the flat files too, as single segments
+        self.dfp.fileformats['flat'] = measfile.XSegFile
+    
+    def parse_files(self, **kwargs):
+        return self.dfp.parse_files(self.lifn, data_cache_bypass=1, **kwargs)
+    
+    def test_engines(self):
+        for engine in ['auto', 'pandas']:
+            for channels in [[-1], [0]]:
+                ref = self.parse_files(data_channels=channels)
+                limf = self.parse_files(data_dtype='float32', 
+                                        data_engine=engine, 
+                                        data_channels=channels)
+                for mf, mf_ref in zip(limf, ref):
+                    self.assertTrue((mf.df.dtypes == np.float32).all())
+                    # The index is kept in float64
+                    self.assertTrue(mf.df.index.equals(mf_ref.df.index))
+                    np.testing.assert_allclose(mf.df.values, 
+                                    mf_ref.df.values, rtol=1e-6)
+    
+    def test_cache(self):
+        dn = tempfile.mkdtemp()
+        try:
+            limf = [self.dfp.parse_files(self.lifn, data_cache_dir=dn, 
+                                         data_dtype=dtype)
+                    for dtype in ['float32', 'float32', 'float64']]
+        finally:
+            shutil.rmtree(dn)
+        self.assertTrue((limf[1][0].df.dtypes == np.float32).all())
+        self.assertTrue((limf[2][0].df.dtypes == np.float64).all())
+    
+    def test_process(self):
+        dp = measfile.DataProcessor()
+        ref = dp.compute(self.parse_files(), data_process='numpy.sum', 
+                         data_process_cache_bypass=1)
+        limf = self.parse_files(data_dtype='float32')
+        for chunksize in [0, 7]:
+            stats = dp.compute(limf, data_process='numpy.sum', 
+                               data_chunksize=chunksize, 
+                               data_process_cache_bypass=1)
+            self.assertTrue((stats.dtypes == np.float64).all())
+            np.testing.assert_allclose(stats.values, ref.values, rtol=1e-6)
+
+
+def span(s):
+    """processor of ParallelProcessor, picklable"""
+    return s.max() - s.min()
+
+
+class StackedProcessor(unittest.TestCase):
+    
+    def setUp(self):
+        dfp = measfile.DataFileParser()
+        self.limf = dfp.parse_files(data.LI_FLATFILE_ALL * 2, 
+                                    data_cache_bypass=1)
+        # Other lengths and columns
+        self.limf[3].df = self.limf[3].df.iloc[:-5]
+        self.limf[4].select([0, 2])
+        self.dp = measfile.DataProcessor()
+        self.dp_ref = measfile.DataProcessor()
+        self.dp_ref.stacked = set()
+    
+    def test_stacked(self):
+        for p in ['trapz', 'numpy.sum', 'numpy.mean', 'numpy.min', 
+                  'numpy.max', 'numpy.std']:
+            for stack_size in [2**28, 1]:
+                self.dp.stack_size = stack_size
+                res = self.dp.compute(self.limf, data_process=p, 
+                                      data_process_cache_bypass=1)
+                ref = self.dp_ref.compute(self.limf, data_process=p, 
+                                          data_process_cache_bypass=1)
+                self.assertEqual(list(res.columns), list(ref.columns))
+                self.assertEqual(list(res.index), list(ref.index))
+                np.testing.assert_allclose(res.values, ref.values)
+    
+    def test_same_columns(self):
+        limf = self.limf[:1] * 3
+        res = self.dp.compute(limf, data_process='numpy.sum', 
+                              data_process_cache_bypass=1)
+        ref = self.dp_ref.compute(limf, data_process='numpy.sum', 
+                                  data_process_cache_bypass=1)
+        self.assertTrue(res.equals(ref))
+
+
+class ParallelProcessor(StackedProcessor):
+    
+    def setUp(self):
+        super(ParallelProcessor, self).setUp()
+        self.dp.processors['span'] = span
+    
+    def test_schedule(self):
+        batches = measfile.schedule([3, 10, 1, 7, 5], jobs=2, batch=2)
+        self.assertEqual(batches, [[1, 3], [4, 0], [2]])
+        self.assertEqual(len(measfile.schedule(range(80), jobs=2)), 8)
+    
+    def test_jobs(self):
+        linames = ['span', 'numpy.sum', 'numpy.median']
+        ref = self.dp.compute(self.limf, data_process=linames, 
+                              data_process_cache_bypass=1)
+        for batch in [0, 1, 3]:
+            stats = self.dp.compute(self.limf, data_process=linames, 
+                                    data_process_jobs=2, 
+                                    data_process_batch=batch, 
+                                    data_process_cache_bypass=1)
+            self.assertTrue(stats.equals(ref))
+
+
+class Slope(object):
+    
+    """processor of BatchedProcessor, the slope of the values against the 
+    index between the first and the last rows"""
+    
+    def __call__(self, s):
+        return (s.iloc[-1] - s.iloc[0]) / (s.index[-1] - s.index[0])
+    
+    def reduce_stack(self, values, index):
+        return (values[-1] - values[0]) / (index[-1] - index[0])
+
+
+class BatchedProcessor(StackedProcessor):
+    
+    def setUp(self):
+        super(BatchedProcessor, self).setUp()
+        self.dp.processors['slope'] = Slope()
+        self.dp_ref.processors['slope'] = lambda s: Slope()(s)
+    
+    def test_batched(self):
+        self.limf[1].df.iloc[0, 0] = np.nan
+        # Without the empty file
+        limf = self.limf[:3] + self.limf[4:]
+        for stack_size in [2**28, 1]:
+            self.dp.stack_size = stack_size
+            res = self.dp.compute(limf, data_process=['slope', 'trapz'], 
+                                  data_process_cache_bypass=1)
+            ref = self.dp_ref.compute(limf, data_process=['slope', 'trapz'], 
+                                      data_process_cache_bypass=1)
+            self.assertEqual(list(res.columns), list(ref.columns))
+            self.assertEqual(list(res.index), list(ref.index))
+            np.testing.assert_allclose(res.values, ref.values)
+    
+    def test_empty(self):
+        res = self.dp.compute(self.limf[3:4], data_process='slope', 
+                              data_process_cache_bypass=1)
+        self.assertTrue(res.isnull().values.all())
+    
+    def test_index(self):
+        limf = [measfile.FlatFile(data.FLATFILE_2) for i in range(3)]
+        limf[1].df.index *= 2
+        lishape = []
+        reduce_stack = Slope.reduce_stack
+        def spy(self, values, index):
+            lishape.append((values.shape[1], index.shape[1]))
+            return reduce_stack(self, values, index)
+        Slope.reduce_stack = spy
+        try:
+            res = self.dp.compute(limf, data_process='slope', 
+                                  data_process_cache_bypass=1)
+        finally:
+            Slope.reduce_stack = reduce_stack
+        np.testing.assert_allclose(res.values[:, 0], res.values[:, 1] * 2)
+        np.testing.assert_allclose(res.values[:, 0], res.values[:, 2])
+        # The files of the same index stacked, with their index once
+        self.assertEqual(sorted(lishape), [(1, 1), (2, 1)])
+
+class MultipleProcessors(StreamedFile):
+    
+    def test_one_pass(self):
+        linames = ['trapz', 'numpy.max', 'numpy.mean']
+        for limf, chunksize in [(self.limf_loaded, 0), (self.limf, 7)]:
+            stats = self.dp.compute(limf, data_process=linames, 
+                                    data_chunksize=chunksize, 
+                                    data_process_cache_bypass=1)
+            self.assertEqual(stats.columns.names, ['process', 'file'])
+            self.assertEqual(list(stats.columns.levels[0]), linames)
+            for p in linames:
+                ref = self.dp.compute(self.limf_loaded, data_process=p, 
+                                      data_process_cache_bypass=1)
+                np.testing.assert_allclose(stats[p].values, ref.values)
+                self.assertEqual(list(stats[p].columns), list(ref.columns))
+
+
+class ResultCache(unittest.TestCase):
+    
+    def setUp(self):
+        self.dn = tempfile.mkdtemp()
+        dfp = measfile.DataFileParser()
+        self.limf = dfp.parse_files(data.LI_FLATFILE_ALL, data_cache_bypass=1)
+        self.dp = measfile.DataProcessor()
+        self.calls = []
+        def count(s):
+            self.calls.append(s.name)
+            return s.sum()
+        self.dp.processors['count'] = count
+        self.kwargs = dict(data_process_cache=os.path.join(self.dn, 'r.db'))
+    
+    def tearDown(self):
+        shutil.rmtree(self.dn)
+    
+    def compute(self, data_process, **kwargs):
+        kwargs.update(self.kwargs)
+        return self.dp.compute(self.limf, data_process=data_process, 
+                               **kwargs)
+    
+    def test_memo(self):
+        ref = self.compute('count', data_process_cache_bypass=1)
+        ncalls = len(self.calls)
+        self.assertTrue(self.compute('count').equals(ref))
+        self.assertEqual(len(self.calls), 2 * ncalls)
+        stats = self.compute('count')
+        self.assertEqual(len(self.calls), 2 * ncalls)
+        self.assertTrue(stats.equals(ref))
+        # Only the new processor is computed
+        stats = self.compute(['numpy.sum', 'count'])
+        self.assertEqual(len(self.calls), 2 * ncalls)
+        np.testing.assert_allclose(stats['count'].values, ref.values)
+    
+    def test_invalidate(self):
+        self.compute('count')
+        ncalls = len(self.calls)
+        self.dp.versions['count'] = 'plugin 2.0'
+        self.compute('count')
+        self.assertEqual(len(self.calls), 2 * ncalls)
+        self.compute('count', data_process_cache_clear=1)
+        self.assertEqual(len(self.calls), 3 * ncalls)
+    
+    def test_evict(self):
+        # Over the size cap, then too old: all the results are evicted
+        self.compute('count', data_process_cache_size=0)
+        ncalls = len(self.calls)
+        self.compute('count', data_process_cache_age=0)
+        self.compute('count')
+        self.assertEqual(len(self.calls), 3 * ncalls)
+        self.compute('count')
+        self.assertEqual(len(self.calls), 3 * ncalls)
+    
+    def test_empty_columns(self):
+        # The columns of flatfile_2 full of Nan values are only dropped 
+        # once the data is read, the results are found all the same
+        computed = []
+        _compute = self.dp._compute
+        def spy(limf, *args, **kwargs):
+            computed.append([mf.bn for mf in limf])
+            return _compute(limf, *args, **kwargs)
+        self.dp._compute = spy
+        ref = self.compute('numpy.sum', data_process_cache_bypass=1)
+        for kwargs in [dict(data_lazy=1), dict(data_chunksize=7)]:
+            for clear in [1, 0]:
+                del computed[:]
+                self.limf = measfile.DataFileParser().parse_files(
+                        data.LI_FLATFILE_ALL, data_cache_bypass=1, **kwargs)
+                stats = self.compute('numpy.sum', 
+                                     data_process_cache_clear=clear, **kwargs)
+                self.assertFalse(any(mf.is_loaded() for mf in self.limf))
+                self.assertEqual(list(stats.index), list(ref.index))
+                np.testing.assert_allclose(stats.values, ref.values)
+            self.assertEqual(computed, [])
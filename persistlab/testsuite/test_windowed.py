@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+    persistlab.testsuite.windowed
+    ~~~~~~~~~~~~~
+
+    This module tests the windowed processors.
+
+    :copyright: (c) 2013 by Stephane Henry..
+    :license: BSD, see LICENSE for more details.
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from persistlab import windowed
+from persistlab import measfile
+from persistlab import data
+
+class Windowed(unittest.TestCase):
+    
+    def setUp(self):
+        x = np.linspace(0, 10, 1001)
+        self.s = pd.Series(np.sin(x), index=x)
+    
+    def derive_chunks(self, p, chunksize):
+        red = p.reduction()
+        lidf = [red.derive(self.s.iloc[i:i+chunksize].to_frame()) 
+                for i in range(0, len(self.s), chunksize)]
+        return pd.concat(lidf + [red.finish()]).iloc[:, 0]
+    
+    def test_chunks(self):
+        for name in windowed.PROCESSORS:
+            p = windowed.Processor(name, window=11, threshold=0.2)
+            ref = p.derive(self.s)
+            for chunksize in [1, 4, 37, 2000]:
+                res = self.derive_chunks(p, chunksize)
+                self.assertTrue(res.index.equals(ref.index))
+                np.testing.assert_allclose(res.values, ref.values)
+    
+    def test_values(self):
+        s = self.s
+        d = windowed.Processor('savgol.derivative', window=11).derive(s)
+        self.assertTrue(np.isnan(d.values[:5]).all())
+        self.assertTrue(np.isnan(d.values[-5:]).all())
+        np.testing.assert_allclose(d.values[5:-5], np.cos(s.index[5:-5]), 
+                                   atol=1e-3)
+        m = windowed.Processor('rolling.mean', window=3).derive(s)
+        self.assertAlmostEqual(m.iloc[1], s.iloc[:3].mean())
+        # sin crosses 0.2 at 0.2, 2.9, 6.5 and 9.2
+        p = windowed.Processor('crossings', threshold=0.2)
+        self.assertEqual(p(s), 4)
+        d = p.derive(s)
+        self.assertTrue(np.isnan(d.iloc[0]))
+        self.assertEqual(list(d.value_counts().sort_index()), [2, 996, 2])
+        # Maxima at pi/2 and 5pi/2, minimum at 3pi/2
+        self.assertEqual(windowed.Processor('extrema')(s), 3)
+    
+    def test_window(self):
+        self.assertRaises(ValueError, windowed.Processor, 
+                          'savgol.derivative', window=2)
+        self.assertRaises(ValueError, windowed.Processor, 
+                          'rolling.mean', window=0)
+        windowed.Processor('crossings', window=0)
+    
+    def test_sliding(self):
+        a = np.arange(5.)
+        v = windowed.sliding(a, 3)
+        np.testing.assert_array_equal(v, [[0, 1, 2], [1, 2, 3], [2, 3, 4]])
+        self.assertTrue(np.may_share_memory(a, v))
+
+
+class WindowedProcessor(unittest.TestCase):
+    
+    def setUp(self):
+        dfp = measfile.DataFileParser()
+        # The streamed files keep their empty columns
+        kwargs = dict(data_channels=[0], data_cache_bypass=1)
+        self.limf = dfp.parse_files(data.LI_FLATFILE_ALL, data_chunksize=7, 
+                                    **kwargs)
+        self.limf_loaded = dfp.parse_files(data.LI_FLATFILE_ALL, **kwargs)
+        self.dp = measfile.DataProcessor()
+    
+    def test_streamed(self):
+        linames = windowed.PROCESSORS.keys()
+        kwargs = dict(data_process=linames, data_window=5, 
+                      data_process_cache_bypass=1)
+        res = self.dp.compute(self.limf, data_chunksize=7, **kwargs)
+        ref = self.dp.compute(self.limf_loaded, **kwargs)
+        self.assertFalse(any(mf.is_loaded() for mf in self.limf))
+        np.testing.assert_allclose(res.values, ref.values)
+    
+    def test_derive(self):
+        self.dp.derive(self.limf, data_derive='rolling.median', 
+                       data_window=3)
+        self.dp.derive(self.limf_loaded, data_derive='rolling.median', 
+                       data_window=3)
+        self.assertFalse(any(mf.is_loaded() for mf in self.limf))
+        for mf, mf_ref in zip(self.limf, self.limf_loaded):
+            lidf = list(mf.iter_chunks(7))
+            self.assertFalse(mf.is_loaded())
+            np.testing.assert_array_equal(pd.concat(lidf).values, 
+                                          mf_ref.dfs().values)
+            self.assertTrue(mf.dfs().equals(mf_ref.dfs()))
+            self.assertEqual(mf.selected_channels(), 
+                             mf_ref.selected_channels())
+        s = self.limf[2].dfs().iloc[:, 0]
+        self.assertTrue(np.isnan(s.iloc[0]))
+        self.assertEqual(s.iloc[1], np.median([-39.57, -42.76, -43.77]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+"""
+    persistlab.windowed
+    ~~~~~~~~~~~~~
+
+    This module implements the windowed processors: rolling mean and
+    median, Savitzky-Golay derivative, threshold crossings and local
+    extrema.
+
+    Each one turns a channel into a derived channel, of the same length,
+    computed on the sliding windows of the samples, viewed as a 2d array
+    by stride tricks without copy. The samples are fed chunk by chunk,
+    the last ones being kept for the windows overlapping the next chunk,
+    so a streamed file gives the same derived channel as a loaded one.
+    The derived channel is also summarised as a statistic of the channel.
+
+    :copyright: 2013 Stephane Henry.
+    :license: BSD, see LICENSE for more details.
+"""
+
+import warnings
+from collections import OrderedDict
+
+import numpy
+import pandas
+from numpy.lib.stride_tricks import as_strided
+
+def sliding(a, window):
+    """return the view of the windows of the 1d array a, one per row"""
+    n = max(len(a) - window + 1, 0)
+    return as_strided(a, shape=(n, window), strides=(a.strides[0],) * 2)
+
+def rolling_mean(a, index, window, **kwargs):
+    """mean of the windows, Nan values skipped"""
+    # Cumulated sums and counts, O(n) whatever the window
+    valid = ~numpy.isnan(a)
+    c = numpy.concatenate([[0.], numpy.cumsum(numpy.where(valid, a, 0.))])
+    n = numpy.concatenate([[0], numpy.cumsum(valid)])
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return (c[window:] - c[:-window]) / (n[window:] - n[:-window])
+
+def rolling_median(a, index, window, **kwargs):
+    with warnings.catch_warnings():
+        # The windows with Nan values have a Nan median
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return numpy.median(sliding(a, window), axis=1)
+
+def savgol_coefficients(window, order=2, deriv=1):
+    """return the weights of the samples of a window giving the deriv-th
+    derivative, in samples, at its center of the polynomial of degree
+    order fitted to them by least squares"""
+    t = numpy.arange(window) - (window - 1) // 2
+    A = numpy.vander(t, order + 1, increasing=True)
+    return numpy.linalg.pinv(A)[deriv] * numpy.math.factorial(deriv)
+
+def savgol_derivative(a, index, window, order=2, **kwargs):
+    if window <= order:
+        raise ValueError('the window must be longer than the polynomial '
+                         'order {}'.format(order))
+    res = sliding(a, window).dot(savgol_coefficients(window, order))
+    # Step of the index, constant over each window
+    step = (index[window-1:] - index[:len(index)-window+1]) / (window - 1)
+    return res / step
+
+def crossings(a, index, window, threshold=0., **kwargs):
+    """+1 where a rises to threshold or above, -1 where it falls below"""
+    above = (a >= threshold).astype(float)
+    return above[1:] - above[:-1]
+
+def extrema(a, index, window, **kwargs):
+    """+1 at the maxima of their window, -1 at the minima, 0 elsewhere
+    and on plateaus"""
+    view = sliding(a, window)
+    center = view[:, (window - 1) // 2]
+    return (center == view.max(axis=1)).astype(float) - \
+            (center == view.min(axis=1))
+
+def nanmax(a):
+    """numpy.nanmax, Nan without warning if all the values are Nan"""
+    a = a[~numpy.isnan(a)]
+    return a.max() if len(a) else numpy.nan
+
+# Summaries of the derived channels: function of a chunk,
+# combination of the results of two chunks
+SUMMARIES = {'max':(nanmax, numpy.fmax),
+             'count':(lambda a: numpy.nansum(numpy.abs(a)), numpy.add)}
+
+# Name: function of the windows, fixed window length or None, summary
+PROCESSORS = OrderedDict([
+    ('rolling.mean', (rolling_mean, None, 'max')),
+    ('rolling.median', (rolling_median, None, 'max')),
+    ('savgol.derivative', (savgol_derivative, None, 'max')),
+    ('crossings', (crossings, 2, 'count')),
+    ('extrema', (extrema, None, 'count'))])
+
+# Name: shortest window, 1 sample for the others
+MIN_WINDOWS = {'savgol.derivative':3}
+
+
+class Windowed(object):
+
+    """Derived channel of the samples fed chunk by chunk.
+
+    The value of a sample is that of the window centered on it,
+    Nan for the samples too close to the ends."""
+
+    def __init__(self, func, window, **kwargs):
+        self.func = func
+        self.window = window
+        self.kwargs = kwargs
+        # Last samples, starting the windows of the next chunk
+        self.values = numpy.empty(0)
+        self.index = numpy.empty(0)
+        # Index of the samples whose window isn't complete yet
+        self.pending = numpy.empty(0)
+        self.count = 0
+
+    def update(self, values, index):
+        """return the index and the derived values computed with the chunk
+        values, of index index"""
+        w = self.window
+        values = numpy.concatenate([self.values, values])
+        index = numpy.concatenate([self.index, numpy.asarray(index, float)])
+        nnew = len(values) - len(self.values)
+        res = numpy.empty(nnew)
+        res.fill(numpy.nan)
+        if len(values) >= w:
+            r = self.func(values, index, w, **self.kwargs)
+            res[len(res)-len(r):] = r
+        start = max(0, len(values) - w + 1)
+        self.values = values[start:]
+        self.index = index[start:]
+        # The window ending on a sample is centered (w-1)//2 samples before
+        pending = numpy.concatenate([self.pending, index[len(index)-nnew:]])
+        res = res[max(0, (w - 1) // 2 - self.count):]
+        self.count += nnew
+        self.pending = pending[len(res):]
+        return pending[:len(res)], res
+
+    def finish(self):
+        """return the index and the Nan values of the last samples"""
+        res = numpy.empty(len(self.pending))
+        res.fill(numpy.nan)
+        return self.pending, res
+
+
+class Processor(object):
+
+    """Windowed processor of the channels, applied to a whole channel by
+    __call__, or chunk by chunk by its reduction"""
+
+    def __init__(self, name, window=11, threshold=0.):
+        self.name = name
+        self.func, fixed, self.summary = PROCESSORS[name]
+        self.window = fixed or window
+        minimum = MIN_WINDOWS.get(name, 1)
+        if self.window < minimum:
+            raise ValueError('the window of {} must be {} samples or '
+                             'longer, not {}'.format(name, minimum, window))
+        self.threshold = threshold
+
+    def windowed(self):
+        return Windowed(self.func, self.window, threshold=self.threshold)
+
+    def derive(self, s):
+        """return the derived channel of the series s"""
+        w = self.windowed()
+        index, res = w.update(s.values.astype(float), s.index.values)
+        index_end, res_end = w.finish()
+        return pandas.Series(numpy.concatenate([res, res_end]),
+                             index=s.index, name=s.name)
+
+    def __call__(self, s):
+        """return the summary of the derived channel of the series s"""
+        return SUMMARIES[self.summary][0](self.derive(s).values)
+
+    def reduction(self):
+        return WindowedReduction(self)
+
+
+class WindowedReduction(object):
+
+    """Summary of the derived channels of the columns of the data given
+    chunk of rows by chunk of rows, a reduction of measfile"""
+
+    def __init__(self, processor):
+        self.processor = processor
+        self.windowed = None
+        self.columns = []
+        self.res = None
+
+    def derive(self, df):
+        """return the derived channels of the chunk df"""
+        if self.windowed is None:
+            self.windowed = [self.processor.windowed() for c in df.columns]
+        self.columns = df.columns
+        lires = [w.update(df.iloc[:, j].values.astype(float), df.index.values)
+                 for j, w in enumerate(self.windowed)]
+        return self._frame(self.columns, lires)
+
+    def finish(self):
+        """return the derived channels of the last samples"""
+        lires = [w.finish() for w in self.windowed or []]
+        return self._frame(self.columns, lires)
+
+    def _frame(self, columns, lires):
+        if not lires:
+            return pandas.DataFrame(columns=columns)
+        values = numpy.column_stack([r for i, r in lires])
+        return pandas.DataFrame(values, index=lires[0][0], columns=columns)
+
+    def update(self, df):
+        self._summarise(self.derive(df))
+
+    def _summarise(self, df):
+        reduce, combine = SUMMARIES[self.processor.summary]
+        s = pandas.Series([reduce(df.iloc[:, j].values)
+                           for j in range(df.shape[1])], index=df.columns)
+        self.res = s if self.res is None else combine(self.res, s)
+
+    def result(self):
+        if self.windowed is not None:
+            self._summarise(self.finish())
+        return self.res